@@ -2,151 +2,2427 @@
 
 # !/usr/bin/env python3
 
-from http.client import HTTPConnection
-from urllib.parse import urlencode
+from http.client import HTTPConnection, HTTPException, BadStatusLine, CannotSendRequest
+from urllib.parse import urlencode, urljoin
 import pandas as pd
 import numpy as np
-from datetime import datetime, date, time
+from datetime import date, time
+from time import monotonic, time as walltime
+from contextlib import contextmanager
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import contextvars
+import asyncio
+import threading
+import socket
+import queue
+import codecs
+import csv
+import io
+import hashlib
+import uuid
+import tracemalloc
+import sqlite3
+import os
 import re
+import json
+import xml.etree.ElementTree as ET
+
+try:
+    import pyarrow  # optional, Feather files for the disk cache
+except ImportError:
+    pyarrow = None
+try:
+    import orjson  # optional, fast JSON decoding
+except ImportError:
+    orjson = None
+try:
+    import simdjson  # optional, fast (and lazy) JSON decoding
+except ImportError:
+    simdjson = None
 
 
 import dash_cytoscape as cyto
 import dash_html_components as html
 import dash_core_components as dcc
+from dash.exceptions import PreventUpdate
 from demos import dash_reusable_components as drc
 
 
 # ------------------------------------------------------
-# Runs SPARQL query at SPARQL endpoint and
-# return results as a Python 'dict' (in the SPARQL1.1 results format)
-# (for SPARQL1.1 results format refer: https://www.w3.org/TR/sparql11-results-json)
+# Thread-safe pool of keep-alive HTTP connections to one SPARQL endpoint
 #
 #       sparql_endpoint: 'host:port' ex: '192.168.0.64:7070', 'data.nobelprize.org'
-#       sparql_query: ex: 'select (count(*) as ?c) {?s?p?o}'
-#       fmt - optional argument, if specified, returns results in a raw string format
-#              possiblea values ('csv','json','xml'), any other format will be treated as 'json'
+#       maxsize: max number of idle connections kept open for reuse
+#       idle_timeout: seconds an idle connection may sit in the pool before it is closed
+#       timeout: socket timeout (seconds) for new connections
+# ------------------------------------------------------
+#
+class ConnectionPool:
+    def __init__(self, sparql_endpoint, maxsize=8, idle_timeout=30, timeout=100):
+        self.endpoint = sparql_endpoint
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self._idle = []  # (conn, last_used), most recently used last
+        self._lock = threading.Lock()
+
+    # returns (conn, reused): a warm connection if one is available (and reuse is
+    # True), else a new one
+    def acquire(self, reuse=True):
+        if reuse:
+            with self._lock:
+                self._evict_idle(monotonic())
+                if self._idle:
+                    return self._idle.pop()[0], True
+        return HTTPConnection(self.endpoint, timeout=self.timeout), False
+
+    # hands a connection back once its response has been read completely
+    def release(self, conn, resp=None):
+        if conn.sock is None or (resp is not None and resp.will_close):
+            conn.close()  # server asked to close, or socket already gone
+            return
+        with self._lock:
+            now = monotonic()
+            self._evict_idle(now)
+            if len(self._idle) < self.maxsize:
+                self._idle.append((conn, now))
+                return
+        conn.close()
+
+    def discard(self, conn):
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            conn.close()
+
+    # caller holds the lock
+    def _evict_idle(self, now):
+        fresh = []
+        for conn, last_used in self._idle:
+            if now - last_used < self.idle_timeout:
+                fresh.append((conn, last_used))
+            else:
+                conn.close()
+        self._idle = fresh
+
+
+connectionPools = {}
+_poolsLock = threading.Lock()
+
+# errors raised when a pooled keep-alive socket was closed by the server while idle
+_STALE_ERRORS = (ConnectionError, BadStatusLine, CannotSendRequest)
+
+
+# returns the (shared) connection pool for sparql_endpoint
+def getConnectionPool(sparql_endpoint):
+    with _poolsLock:
+        pool = connectionPools.get(sparql_endpoint)
+        if pool is None:
+            pool = ConnectionPool(sparql_endpoint)
+            connectionPools[sparql_endpoint] = pool
+        return pool
+
+
+def closeConnectionPools():
+    with _poolsLock:
+        pools = list(connectionPools.values())
+        connectionPools.clear()
+    for pool in pools:
+        pool.close()
+
+
+# ------------------------------------------------------
+# POSTs sparql_query over a pooled connection and returns (pool, conn, resp)
+# the caller must read resp fully and then pool.release(conn, resp), or pool.discard(conn)
+# a reused connection that turns out to be stale is dropped and the request is retried
+# on a fresh connection; a request that is not idempotent (a SPARQL update) is never
+# resent, it always goes out on a fresh connection instead
+# timeout (seconds) overrides the pool's socket timeout
+# the connection is registered with token (a CancelToken) so that cancelling it
+# aborts the request; the caller unregisters it when done with the response
 # ------------------------------------------------------
 #
-def run_query(sparql_endpoint, sparql_query, fmt=None):
-    # create HTTP connection to SPARQL endpoint
-    conn = HTTPConnection(sparql_endpoint, timeout=100)  # may throw HTTPConnection exception
+def _post_query(sparql_endpoint, sparql_query, hdrs, timeout=None, token=None, idempotent=True):
+    pool = getConnectionPool(sparql_endpoint)
     # urlencode query for sending
     docbody = urlencode({'query': sparql_query})
+    while True:
+        conn, reused = pool.acquire(reuse=idempotent)
+        conn.timeout = pool.timeout if timeout is None else timeout
+        if conn.sock is not None:
+            conn.sock.settimeout(conn.timeout)
+        try:
+            if token is not None:
+                if conn.sock is None:
+                    conn.connect()  # so that a cancel() from now on has a socket to shut down
+                token.register(conn)
+                token.check()
+            # send post request
+            conn.request('POST', '/sparql', docbody, hdrs)  # may throw exception
+            resp = conn.getresponse()
+        except _STALE_ERRORS:
+            pool.discard(conn)
+            if token is not None:
+                token.unregister(conn)
+            if reused:
+                continue  # keep-alive socket went stale while idle, reconnect
+            raise
+        except Exception:
+            pool.discard(conn)
+            if token is not None:
+                token.unregister(conn)
+            raise
+        return pool, conn, resp
+
+
+# ------------------------------------------------------
+# Deadlines: a time budget shared by every query run inside a queryDeadline()
+# block (including queries run on other threads by this module); each request
+# gets the remaining budget as its socket timeout and has its socket shut down
+# when the budget runs out while its response is still being read, and once the
+# budget is spent queries fail with DeadlineExceeded instead of waiting for the server
+# ------------------------------------------------------
+#
+class DeadlineExceeded(Exception):
+    pass
+
+
+class Deadline:
+    def __init__(self, seconds):
+        self.expires = monotonic() + seconds
+
+    def remaining(self):
+        return max(0.0, self.expires - monotonic())
+
+    def expired(self):
+        return monotonic() >= self.expires
+
+    # raises DeadlineExceeded if the budget is spent, else returns the remaining seconds
+    def check(self):
+        remaining = self.remaining()
+        if remaining <= 0:
+            raise DeadlineExceeded('Query deadline exceeded')
+        return remaining
+
+
+_currentDeadline = contextvars.ContextVar('anzograph_deadline', default=None)
+
+
+# with queryDeadline(2.5): ... -- seconds None leaves the current deadline in place,
+# a nested block can only shorten the enclosing budget
+@contextmanager
+def queryDeadline(seconds):
+    outer = _currentDeadline.get()
+    if seconds is None:
+        yield outer
+        return
+    deadline = Deadline(seconds)
+    if outer is not None and outer.expires < deadline.expires:
+        deadline = outer
+    token = _currentDeadline.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _currentDeadline.reset(token)
+
+
+def currentDeadline():
+    return _currentDeadline.get()
+
+
+# ------------------------------------------------------
+# Cancellation: queries run inside a cancellable(token) block register their
+# connections with the token; token.cancel() (from any thread) shuts those
+# sockets down, so the blocked requests fail fast with QueryCancelled and the
+# server sees the client go away (SPARQL has no standard cancel request)
+# ------------------------------------------------------
+#
+class QueryCancelled(Exception):
+    pass
+
+
+class CancelToken:
+    # a token created with a parent is cancelled together with it
+    def __init__(self, parent=None):
+        self.cancelled = False
+        # conn -> its socket when registered: the response to a 'Connection: close'
+        # request goes on reading the socket after http.client clears conn.sock
+        self._conns = {}
+        self._children = []
+        self._lock = threading.Lock()
+        self._parent = parent
+        if parent is not None:
+            parent._adopt(self)
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            conns = list(self._conns.items())
+            children = list(self._children)
+        for conn, sock in conns:
+            sock = conn.sock or sock
+            if sock is not None:
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)  # wakes up a thread blocked reading it
+                except OSError:
+                    pass
+        for child in children:
+            child.cancel()
+
+    def check(self):
+        if self.cancelled:
+            raise QueryCancelled('Query cancelled')
+
+    def register(self, conn):
+        with self._lock:
+            self._conns[conn] = conn.sock
+
+    def unregister(self, conn):
+        with self._lock:
+            self._conns.pop(conn, None)
+
+    def _adopt(self, child):
+        with self._lock:
+            self._children.append(child)
+            cancelled = self.cancelled
+        if cancelled:
+            child.cancel()
+
+    # drops this token from its parent once it is no longer needed
+    def detach(self):
+        parent, self._parent = self._parent, None
+        if parent is not None:
+            with parent._lock:
+                if self in parent._children:
+                    parent._children.remove(self)
+
+
+_currentCancelToken = contextvars.ContextVar('anzograph_cancel_token', default=None)
+
+
+@contextmanager
+def cancellable(token):
+    reset = _currentCancelToken.set(token)
+    try:
+        yield token
+    finally:
+        _currentCancelToken.reset(reset)
+
+
+def currentCancelToken():
+    return _currentCancelToken.get()
+
+
+_latestTokens = {}
+_latestTokensLock = threading.Lock()
+
+
+# with supersede(key): ... -- runs the block under a new CancelToken and cancels the
+# queries of an earlier block with the same key that is still running. The key must
+# identify one user, e.g. (callback name, session id); key None supersedes nothing.
+@contextmanager
+def supersede(key):
+    token = CancelToken()
+    previous = None
+    if key is not None:
+        with _latestTokensLock:
+            previous = _latestTokens.get(key)
+            _latestTokens[key] = token
+    if previous is not None:
+        previous.cancel()
+    try:
+        with cancellable(token):
+            yield token
+    finally:
+        if key is not None:
+            with _latestTokensLock:
+                if _latestTokens.get(key) is token:
+                    del _latestTokens[key]
+
+
+# ------------------------------------------------------
+# Ingestion metrics: run_query and create_dataframe record where the time of a call
+# went, the numbers of a DataFrame are in df.attrs['metrics']
+#       latency: seconds from sending the request to having read the response
+#       ttfb: seconds from sending the request to receiving the response headers
+#       bytes: size of the response body
+#       decode_time: seconds parsing the response (JSON/XML/TSV/CSV)
+#       typing_time: seconds building typed DataFrame columns
+#       rows: number of result rows
+#       total_time: seconds spent in the call
+#       cache: 'memory' or 'disk' when the result came from a cache
+#       peak_memory: bytes allocated at the peak of the call, only while tracemalloc
+#                    is tracing (enableMetrics(trace_memory=True))
+# with enableMetrics() every call is also appended to metricsCollector, whose
+# table() is a DataFrame with one row per call
+# ------------------------------------------------------
+#
+class MetricsCollector:
+    def __init__(self, max_records=1000):
+        self.records = deque(maxlen=max_records)
+        self.lock = threading.Lock()
+
+    def add(self, record):
+        with self.lock:
+            self.records.append(record)
+
+    def clear(self):
+        with self.lock:
+            self.records.clear()
+
+    def table(self):
+        with self.lock:
+            records = list(self.records)
+        return pd.DataFrame(records, columns=_METRICS_COLUMNS)
+
+
+_METRICS_COLUMNS = ['call', 'endpoint', 'query', 'started', 'total_time', 'latency', 'ttfb', 'bytes',
+                    'decode_time', 'typing_time', 'rows', 'cache', 'peak_memory']
+metricsCollector = None
+_currentMetrics = contextvars.ContextVar('anzograph_metrics', default=None)
+_metricsStartedTracing = False  # tracemalloc was started by enableMetrics, not by the user
+
+
+def enableMetrics(max_records=1000, trace_memory=False):
+    global metricsCollector, _metricsStartedTracing
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        _metricsStartedTracing = True
+    metricsCollector = MetricsCollector(max_records)
+    return metricsCollector
+
+
+def disableMetrics():
+    global metricsCollector, _metricsStartedTracing
+    metricsCollector = None
+    if _metricsStartedTracing:
+        _metricsStartedTracing = False
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+
+# records the metrics of one run_query/create_dataframe call (yields its dict)
+@contextmanager
+def measuredQuery(call, sparql_endpoint, sparql_query):
+    metrics = {'call': call, 'endpoint': getEndpoint(sparql_endpoint).name,
+               'query': ' '.join(sparql_query.split())[:200], 'started': walltime()}
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        baseline = tracemalloc.get_traced_memory()[0]
+        if hasattr(tracemalloc, 'reset_peak'):  # Python 3.9+
+            tracemalloc.reset_peak()
+    start = monotonic()
+    reset = _currentMetrics.set(metrics)
+    try:
+        yield metrics
+    finally:
+        _currentMetrics.reset(reset)
+        metrics['total_time'] = monotonic() - start
+        if tracing and tracemalloc.is_tracing():
+            metrics['peak_memory'] = max(tracemalloc.get_traced_memory()[1] - baseline, 0)
+        collector = metricsCollector
+        if collector is not None:
+            collector.add(metrics)
+
+
+# adds fields to the metrics of the call being measured (no-op outside measuredQuery)
+def recordMetrics(**fields):
+    metrics = _currentMetrics.get()
+    if metrics is not None:
+        metrics.update(fields)
+
+
+# ------------------------------------------------------
+# SPARQL endpoint made of one or more read replicas ('host:port' strings)
+#
+#       replicas: 'host:port' or list of 'host:port'
+#       strategy: 'round_robin' or 'least_outstanding' (fewest requests in flight)
+#       max_failures: consecutive failures (connection errors, HTTP 5xx) after which
+#                     a replica is taken out of rotation
+#       cooldown: seconds a failed replica stays out of rotation before it is tried again
+#       name: identifies the endpoint in cache keys (default: the joined replica list)
+#       hedge_after: seconds after which a read query still waiting for its response is
+#                    duplicated to another replica, the first response wins (None: no hedging)
+#       primary: 'host:port' SPARQL updates are sent to (default: the first replica);
+#                updates are never load balanced, hedged, failed over or retried
+# health is tracked passively from the outcome of real queries; when every
+# replica is out of rotation the one that comes back first is used anyway
+# ------------------------------------------------------
+#
+class EndpointConfig:
+    def __init__(self, replicas, strategy='round_robin', max_failures=3, cooldown=30, name=None,
+                 hedge_after=None, primary=None):
+        if isinstance(replicas, str):
+            replicas = [replicas]
+        if not replicas:
+            raise ValueError('EndpointConfig needs at least one replica')
+        if strategy not in ('round_robin', 'least_outstanding'):
+            raise ValueError('Unknown load balancing strategy: ' + str(strategy))
+        self.replicas = list(replicas)
+        self.strategy = strategy
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.name = name or ','.join(self.replicas)
+        self.hedge_after = hedge_after
+        self.primary = primary or self.replicas[0]
+        hosts = self.replicas + [self.primary] * (self.primary not in self.replicas)
+        self._outstanding = dict.fromkeys(hosts, 0)
+        self._failures = dict.fromkeys(hosts, 0)
+        self._down_until = dict.fromkeys(hosts, 0.0)
+        self._next = 0
+        self._lock = threading.Lock()
+
+    def __str__(self):
+        return self.name
+
+    # picks a replica for one request (avoiding those in exclude if possible), the
+    # primary for an update; pair with release()
+    def acquire(self, exclude=(), update=False):
+        with self._lock:
+            if update:
+                self._outstanding[self.primary] += 1
+                return self.primary
+            now = monotonic()
+            candidates = [r for r in self.replicas if r not in exclude] or list(self.replicas)
+            healthy = [r for r in candidates if self._down_until[r] <= now]
+            if not healthy:
+                healthy = [min(candidates, key=lambda r: self._down_until[r])]
+            start = self._next % len(healthy)
+            self._next += 1
+            healthy = healthy[start:] + healthy[:start]  # rotate, also spreads ties
+            if self.strategy == 'least_outstanding':
+                replica = min(healthy, key=lambda r: self._outstanding[r])
+            else:
+                replica = healthy[0]
+            self._outstanding[replica] += 1
+            return replica
+
+    # healthy: True/False records the outcome, None (e.g. deadline ran out) records nothing
+    def release(self, replica, healthy=True):
+        with self._lock:
+            self._outstanding[replica] -= 1
+            if healthy is None:
+                return
+            if healthy:
+                self._failures[replica] = 0
+                self._down_until[replica] = 0.0
+                return
+            self._failures[replica] += 1
+            if self._failures[replica] >= self.max_failures:
+                self._down_until[replica] = monotonic() + self.cooldown
+
+    def stats(self):
+        with self._lock:
+            now = monotonic()
+            return {r: {'outstanding': self._outstanding[r], 'failures': self._failures[r],
+                        'healthy': self._down_until[r] <= now} for r in self._outstanding}
+
+
+defaultEndpoint = EndpointConfig('127.0.0.1:7070')
+_endpoints = {}
+_endpointsLock = threading.Lock()
+
+
+# replaces the endpoint used by the graph browser helpers when none is passed
+def setEndpoint(replicas, strategy='round_robin', **kwargs):
+    global defaultEndpoint
+    if not isinstance(replicas, EndpointConfig):
+        replicas = EndpointConfig(replicas, strategy, **kwargs)
+    defaultEndpoint = replicas
+    return defaultEndpoint
+
+
+# returns the EndpointConfig for sparql_endpoint: an EndpointConfig, a 'host:port'
+# string (one shared config per string, so its health is tracked too) or None (defaultEndpoint)
+def getEndpoint(sparql_endpoint=None):
+    if sparql_endpoint is None:
+        return defaultEndpoint
+    if isinstance(sparql_endpoint, EndpointConfig):
+        return sparql_endpoint
+    with _endpointsLock:
+        endpoint = _endpoints.get(sparql_endpoint)
+        if endpoint is None:
+            endpoint = _endpoints[sparql_endpoint] = EndpointConfig(sparql_endpoint)
+        return endpoint
+
+
+# ------------------------------------------------------
+# In-memory LRU cache of query results with a TTL and a byte budget
+#
+#       max_bytes: total size of cached results before least recently used entries are evicted
+#       ttl: seconds a result stays valid (None: no expiry)
+# entries remember the graphs their query reads (FROM/GRAPH <...>), so that
+# invalidate(graphName) drops only results that may depend on that graph
+# ------------------------------------------------------
+#
+class QueryCache:
+    def __init__(self, max_bytes=64 << 20, ttl=300):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (value, size, expires, graphs)
+        self._lock = threading.Lock()
+        # callbacks(graphName) run by invalidate, for caches derived from query results
+        self.dependents = []
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[2] is not None and entry[2] < monotonic():
+                self._remove(key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size, graphs=()):
+        if size > self.max_bytes:
+            return  # would evict everything else
+        expires = None if self.ttl is None else monotonic() + self.ttl
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, size, expires, frozenset(graphs))
+            self.nbytes += size
+            while self.nbytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    # graphName None clears the cache; otherwise drops entries reading graphName
+    # and entries without FROM/GRAPH, which read the default (union) graph
+    def invalidate(self, graphName=None):
+        if graphName is not None:
+            graphName = graphName.strip()
+        with self._lock:
+            if graphName is None:
+                self._entries.clear()
+                self.nbytes = 0
+            else:
+                stale = [key for key, entry in self._entries.items()
+                         if not entry[3] or graphName in entry[3]]
+                for key in stale:
+                    self._remove(key)
+        for dependent in list(self.dependents):
+            dependent(graphName)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {'entries': len(self._entries), 'bytes': self.nbytes,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'hit_rate': self.hits / lookups if lookups else 0.0}
+
+    # caller holds the lock
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.nbytes -= entry[1]
+
+
+queryCache = QueryCache()
+
+# string literals and IRIs are kept verbatim; runs of whitespace and comments collapse to one space
+_QUERY_TOKENS = re.compile(r'("""[\s\S]*?"""|\'\'\'[\s\S]*?\'\'\'|"(?:[^"\\\n]|\\.)*"|\'(?:[^\'\\\n]|\\.)*\'|<[^<>"{}|^`\\\s]*>)'
+                           r'|((?:\s|#[^\n]*)+)')
+_QUERY_GRAPHS = re.compile(r'\b(?:from(?:\s+named)?|graph|with|into)\s+(<[^<>"{}|^`\\\s]*>)', re.I)
+_READ_QUERY = re.compile(r'^(?:(?:prefix\s+[^\s:]*:\s*<[^>]*>|base\s+<[^>]*>)\s*)*(?:select|construct|ask|describe)\b', re.I)
+
+
+# normalized query text used in cache keys
+def normalize_query(sparql_query):
+    return _QUERY_TOKENS.sub(lambda m: m.group(1) or ' ', sparql_query).strip()
+
+
+def _query_graphs(sparql_query):
+    return set(_QUERY_GRAPHS.findall(sparql_query))
+
+
+# True for SELECT/CONSTRUCT/ASK/DESCRIBE, False for updates
+def _is_read_query(sparql_query):
+    return _READ_QUERY.match(normalize_query(sparql_query)) is not None
+
+
+# returns the cache key for a read query, or None for updates (which invalidate their graphs)
+def _cache_key(kind, sparql_endpoint, sparql_query, fmt=None):
+    text = normalize_query(sparql_query)
+    if not _READ_QUERY.match(text):
+        graphs = _query_graphs(text)
+        for graph in graphs or (None,):
+            queryCache.invalidate(graph)
+            if diskCache is not None:
+                diskCache.invalidate(graph)
+        return None
+    return (kind, getEndpoint(sparql_endpoint).name, text, fmt)
+
+
+# ------------------------------------------------------
+# Single-flight request coalescing: while a call for key is running, later
+# callers of do() with the same key wait for it and share its result (or its
+# exception) instead of running func again
+# ------------------------------------------------------
+#
+class SingleFlight:
+    class _Call:
+        def __init__(self):
+            self.done = threading.Event()
+            self.result = None
+            self.error = None
+
+    def __init__(self):
+        self.coalesced = 0
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = SingleFlight._Call()
+            else:
+                self.coalesced += 1
+        if not leader:
+            self._wait(call)
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = func()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    # a follower stops waiting for the leader when its own deadline runs out or its
+    # own cancel token is cancelled (checked every poll_interval seconds)
+    poll_interval = 0.05
+
+    def _wait(self, call):
+        deadline = currentDeadline()
+        token = currentCancelToken()
+        while True:
+            timeout = deadline.check() if deadline is not None else None
+            if token is not None:
+                token.check()
+                timeout = self.poll_interval if timeout is None else min(timeout, self.poll_interval)
+            if call.done.wait(timeout):
+                return
+
+
+inflightQueries = SingleFlight()
+
+
+# ------------------------------------------------------
+# Opt-in on-disk cache of create_dataframe results that survives kernel restarts
+# results are stored as Feather files (pickle when pyarrow is not installed or a
+# column cannot be written as Arrow) named by the SHA-256 of endpoint and
+# normalized query; a SQLite index keeps validation metadata (size, rows,
+# columns, graphs read, creation time) and access times for eviction
+#
+#       path: cache directory
+#       max_bytes: total size of cached files before least recently used ones are deleted
+#       max_age: seconds a result stays valid (None: until invalidated or evicted)
+# ------------------------------------------------------
+#
+class DiskCache:
+    def __init__(self, path, max_bytes=1 << 30, max_age=None):
+        self.path = os.path.expanduser(path)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.path, exist_ok=True)
+        with self._connect() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS entries ('
+                       'key TEXT PRIMARY KEY, file TEXT, format TEXT, size INTEGER, rows INTEGER, '
+                       'columns TEXT, graphs TEXT, endpoint TEXT, query TEXT, created REAL, accessed REAL)')
+
+    def _connect(self):
+        return sqlite3.connect(os.path.join(self.path, 'index.sqlite'), timeout=30)
+
+    @staticmethod
+    def key(sparql_endpoint, normalized_query):
+        return hashlib.sha256((sparql_endpoint + '\n' + normalized_query).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self._lock, self._connect() as db:
+            row = db.execute('SELECT file, format, size, rows, columns, created FROM entries WHERE key = ?',
+                             (key,)).fetchone()
+            df = None
+            if row is not None:
+                df = self._load(row)
+                if df is None:
+                    self._delete(db, key, row[0])
+                else:
+                    db.execute('UPDATE entries SET accessed = ? WHERE key = ?', (walltime(), key))
+            if df is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return df
+
+    # returns the DataFrame of an index row, or None if it is missing, expired or does not validate
+    def _load(self, row):
+        fname, fmt, size, rows, columns, created = row
+        fpath = os.path.join(self.path, fname)
+        if self.max_age is not None and walltime() - created > self.max_age:
+            return None
+        try:
+            if os.path.getsize(fpath) != size:
+                return None
+            df = pd.read_feather(fpath) if fmt == 'feather' else pd.read_pickle(fpath)
+        except Exception:
+            return None
+        if len(df) != rows or [str(c) for c in df.columns] != json.loads(columns):
+            return None
+        return df
+
+    def put(self, key, df, sparql_endpoint, normalized_query, graphs=()):
+        fname = key + '.feather'
+        fmt = 'feather'
+        tmp = os.path.join(self.path, key + '.tmp')
+        try:
+            if pyarrow is None:
+                raise ImportError('pyarrow is not installed')
+            df.to_feather(tmp)
+        except Exception:  # no pyarrow, or object columns Arrow cannot represent
+            fname = key + '.pkl'
+            fmt = 'pickle'
+            df.to_pickle(tmp)
+        os.replace(tmp, os.path.join(self.path, fname))
+        size = os.path.getsize(os.path.join(self.path, fname))
+        now = walltime()
+        with self._lock, self._connect() as db:
+            old = db.execute('SELECT file FROM entries WHERE key = ?', (key,)).fetchone()
+            if old is not None and old[0] != fname:
+                self._remove_file(old[0])
+            db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                       (key, fname, fmt, size, len(df), json.dumps([str(c) for c in df.columns]),
+                        json.dumps(sorted(graphs)), sparql_endpoint, normalized_query, now, now))
+            self._evict(db)
+
+    # graphName None clears the cache; otherwise drops entries reading graphName or the default graph
+    def invalidate(self, graphName=None):
+        with self._lock, self._connect() as db:
+            for key, fname, graphs in db.execute('SELECT key, file, graphs FROM entries').fetchall():
+                graphs = json.loads(graphs)
+                if graphName is None or not graphs or graphName.strip() in graphs:
+                    self._delete(db, key, fname)
+
+    def stats(self):
+        with self._lock, self._connect() as db:
+            entries, nbytes = db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        return {'entries': entries, 'bytes': nbytes, 'hits': self.hits, 'misses': self.misses}
+
+    # caller holds the lock
+    def _evict(self, db):
+        total = db.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, fname, size in db.execute('SELECT key, file, size FROM entries ORDER BY accessed').fetchall():
+            self._delete(db, key, fname)
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def _delete(self, db, key, fname):
+        db.execute('DELETE FROM entries WHERE key = ?', (key,))
+        self._remove_file(fname)
+
+    def _remove_file(self, fname):
+        try:
+            os.remove(os.path.join(self.path, fname))
+        except OSError:
+            pass
+
+
+diskCache = None
+
+
+# turns on the disk cache for create_dataframe (see DiskCache) and returns it
+def enableDiskCache(path='~/.cache/anzograph', max_bytes=1 << 30, max_age=None):
+    global diskCache
+    diskCache = DiskCache(path, max_bytes, max_age)
+    return diskCache
+
+
+def disableDiskCache():
+    global diskCache
+    diskCache = None
+
+
+# request headers for the given result format (see run_query)
+def _request_headers(fmt=None):
     # request result in json
     hdrs = {'Accept': 'application/sparql-results+json',
-            'Content-type': 'application/x-www-form-urlencoded'}
-    raw = False
-    if fmt is not None:
-        raw = True
-        if fmt in ('xml', 'XML'):
-            hdrs['Accept'] = 'application/sparql-results+xml'
-        elif fmt in ('csv', 'CSV'):
-            hdrs['Accept'] = 'text/csv, application/sparql-results+csv'
-
-    # send post request
-    conn.request('POST', '/sparql', docbody, hdrs)  # may throw exception
-
-    # read response
-    resp = conn.getresponse()
-    if 200 != resp.status:
-        errmsg = resp.read()
-        conn.close()
-        raise Exception('Query Error', errmsg)  # query processing errors - syntax errors, etc.
+            'Content-type': 'application/x-www-form-urlencoded',
+            'Connection': 'keep-alive'}
+    if fmt in ('xml', 'XML'):
+        hdrs['Accept'] = 'application/sparql-results+xml'
+    elif fmt in ('csv', 'CSV'):
+        hdrs['Accept'] = 'text/csv, application/sparql-results+csv'
+    elif fmt in ('tsv', 'TSV'):
+        hdrs['Accept'] = 'text/tab-separated-values, application/sparql-results+tsv'
+    elif fmt in ('nt', 'NT'):
+        hdrs['Accept'] = 'application/n-triples, text/turtle;q=0.9, text/plain;q=0.5'
+    return hdrs
 
-    # content-type header, and actual response data
-    ctype = resp.getheader('content-type', 'text/html').lower()
-    result = resp.read().lstrip()
-    conn.close()
 
-    # check response content-type header
-    if raw or ctype.find('json') < 0:
-        return result  # not a SELECT?
+# ------------------------------------------------------
+# Runs SPARQL query at SPARQL endpoint and yields the (unread) HTTP response
+# for streaming consumers; the pooled connection is returned to the pool once
+# the response has been read to the end, and closed if the caller stops early
+# a read query goes to a replica picked by the EndpointConfig and fails over to the
+# remaining ones if that replica cannot be reached; an update goes to the primary only
+#
+#       sparql_endpoint: 'host:port' ex: '192.168.0.64:7070', 'data.nobelprize.org',
+#                        or an EndpointConfig
+#       sparql_query: ex: 'select (count(*) as ?c) {?s?p?o}'
+#       fmt - optional argument, result format requested ('csv','json','xml')
+#       exclude - optional argument, replicas not to send the query to (if others are available)
+#       picked - optional argument, list the chosen replica(s) are appended to
+# ------------------------------------------------------
+#
+@contextmanager
+def query_response(sparql_endpoint, sparql_query, fmt=None, exclude=(), picked=None):
+    endpoint = getEndpoint(sparql_endpoint)
+    deadline = currentDeadline()
+    token = currentCancelToken()
+    hdrs = _request_headers(fmt)
+    tried = list(exclude)
+    read = _is_read_query(sparql_query)
+
+    # the exception to raise for e once the request was cancelled or ran out of time,
+    # None if it was neither; a request that outlives the deadline has its socket
+    # shut down by a timer (so a body trickling in cannot hold the caller past it)
+    def interrupted(e, requestToken):
+        if token is not None and token.cancelled:
+            return e if isinstance(e, QueryCancelled) else QueryCancelled('Query cancelled')
+        if deadline is None:
+            return None
+        if requestToken.cancelled or isinstance(e, (OSError, HTTPException)) and deadline.expired():
+            return e if isinstance(e, DeadlineExceeded) else DeadlineExceeded('Query deadline exceeded')
+        return None
+
+    while True:
+        if token is not None:
+            token.check()
+        timeout = deadline.check() if deadline is not None else None
+        requestToken = token
+        expiry = None
+        if deadline is not None:
+            requestToken = CancelToken(token)
+            expiry = threading.Timer(timeout, requestToken.cancel)
+            expiry.daemon = True
+            expiry.start()
+        replica = endpoint.acquire(exclude=tried, update=not read)
+        if picked is not None:
+            picked.append(replica)
+        try:
+            pool, conn, resp = _post_query(replica, sparql_query, hdrs, timeout, requestToken, read)
+        except (QueryCancelled, OSError, HTTPException) as e:
+            if expiry is not None:
+                expiry.cancel()
+                requestToken.detach()
+            error = interrupted(e, requestToken)
+            if error is not None:
+                endpoint.release(replica, healthy=None)
+                if error is e:
+                    raise
+                raise error from e
+            endpoint.release(replica, healthy=False)
+            tried.append(replica)
+            if read and len(set(tried)) < len(endpoint.replicas):
+                continue  # replica unreachable, fail over to the next one
+            raise
+        break
+
+    healthy = True
+    try:
+        if 200 != resp.status:
+            errmsg = resp.read()
+            pool.release(conn, resp)
+            healthy = resp.status < 500
+            raise Exception('Query Error', errmsg)  # query processing errors - syntax errors, etc.
+        yield resp
+        if expiry is not None and requestToken.cancelled:
+            raise DeadlineExceeded('Query deadline exceeded')  # the body may have been cut short
+    except BaseException as e:
+        if not resp.isclosed():
+            pool.discard(conn)
+        if isinstance(e, GeneratorExit):  # the caller stopped reading early
+            if requestToken is not None and requestToken.cancelled:
+                healthy = None
+            raise
+        error = interrupted(e, requestToken)
+        if error is not None:
+            healthy = None
+            if error is e:
+                raise
+            raise error from e
+        if isinstance(e, (OSError, HTTPException)):
+            healthy = False
+        raise
+    finally:
+        if expiry is not None:
+            expiry.cancel()
+        endpoint.release(replica, healthy)
+        if requestToken is not None:
+            requestToken.unregister(conn)
+            if expiry is not None:
+                requestToken.detach()
+    if resp.isclosed() and not (requestToken is not None and requestToken.cancelled):
+        pool.release(conn, resp)
+    else:
+        pool.discard(conn)  # body not fully consumed (or socket shut down), cannot be reused
+
+
+# ------------------------------------------------------
+# Runs SPARQL query at SPARQL endpoint and
+# return results as a Python 'dict' (in the SPARQL1.1 results format)
+# (for SPARQL1.1 results format refer: https://www.w3.org/TR/sparql11-results-json)
+# connections are kept alive and reused through the endpoint's ConnectionPool
+#
+#       sparql_endpoint: 'host:port' ex: '192.168.0.64:7070', 'data.nobelprize.org'
+#       sparql_query: ex: 'select (count(*) as ?c) {?s?p?o}'
+#       fmt - optional argument, if specified, returns results in a raw string format
+#              possiblea values ('csv','tsv','json','xml'), any other format will be treated as 'json'
+#       cache - optional argument, if False bypasses queryCache
+# ------------------------------------------------------
+#
+def run_query(sparql_endpoint, sparql_query, fmt=None, cache=True):
+    with measuredQuery('run_query', sparql_endpoint, sparql_query):
+        ctype, result = _run_query_raw(sparql_endpoint, sparql_query, fmt, cache)
+
+        # check response content-type header
+        if fmt is not None or ctype.find('json') < 0:
+            return result  # not a SELECT?
+
+        # convert result in JSON string into python dict
+        started = monotonic()
+        result = jsonDecoder.loads(result)
+        recordMetrics(decode_time=monotonic() - started)
+        return result
+
+
+# (content-type, response bytes) of sparql_query, through queryCache and inflightQueries
+def _run_query_raw(sparql_endpoint, sparql_query, fmt=None, cache=True):
+    key = _cache_key('raw', sparql_endpoint, sparql_query, fmt)
+    cached = queryCache.get(key) if cache and key is not None else None
+    if cached is not None:
+        recordMetrics(cache='memory', bytes=len(cached[1]))
+    else:
+        fetch = partial(_fetch_raw, sparql_endpoint, sparql_query, fmt, key is not None)
+        cached = fetch() if key is None else _join_flight(key, fetch)
+        if cache and key is not None:
+            queryCache.put(key, cached, len(cached[1]), _query_graphs(key[2]))
+    return cached
+
 
-    # convert result in JSON string into python dict
-    return json.loads(result)
+# ------------------------------------------------------
+# JSON decoder backend used by run_query and create_dataframe: orjson or simdjson
+# when installed, the standard library json module otherwise
+#       loads(payload): plain Python dicts and lists
+#       lazy(payload): a document whose rows may be decoded on access; with
+#                      simdjson, bindings are only decoded as create_dataframe reads
+#                      them column by column, no dict-per-row tree is built
+# setJsonDecoder('orjson' | 'simdjson' | 'json') picks a backend, any callable
+# taking bytes is used as-is, None picks the fastest one installed
+# ------------------------------------------------------
+#
+class JsonDecoder:
+    def __init__(self, name, loads, lazy=None):
+        self.name = name
+        self.loads = loads
+        self.lazy = lazy or loads
+
+    def __repr__(self):
+        return 'JsonDecoder(%r)' % self.name
+
+
+def _json_decoders():
+    decoders = OrderedDict()
+    if orjson is not None:
+        decoders['orjson'] = JsonDecoder('orjson', orjson.loads)
+    if simdjson is not None:
+        # a simdjson Parser holds one document at a time, so each payload gets its own
+        decoders['simdjson'] = JsonDecoder('simdjson', simdjson.loads, lambda payload: simdjson.Parser().parse(payload))
+    decoders['json'] = JsonDecoder('json', json.loads)
+    return decoders
+
+
+jsonDecoder = next(iter(_json_decoders().values()))
+
+
+def setJsonDecoder(decoder=None):
+    global jsonDecoder
+    decoders = _json_decoders()
+    if decoder is None:
+        jsonDecoder = next(iter(decoders.values()))
+    elif callable(decoder):
+        jsonDecoder = JsonDecoder(getattr(decoder, '__name__', 'custom'), decoder)
+    elif decoder in decoders:
+        jsonDecoder = decoders[decoder]
+    else:
+        raise ImportError('JSON decoder not available: ' + str(decoder))
+    return jsonDecoder
 
 
 # ------------------------------------------------------
 # Returns pandas DataFrame from the results of running a sparql_query at sparql_endpoint
 #       sparql_endpoint: 'host:port' ex: '192.168.0.64:7070', 'data.nobelprize.org'
 #       sparql_query: ex: 'select (count(*) as ?c) {?s?p?o}'
+#       cache: optional argument, if False bypasses queryCache (and diskCache when enabled)
+#       fmt: optional argument, results format fetched from the server: 'json' (default),
+#            'xml' (streamed with XmlBindingsReader), 'tsv' (keeps IRIs and datatypes,
+#            parsed with pandas' C parser) or 'csv' (IRIs and datatypes are inferred,
+#            see csv_to_dataframe)
+#       terms: optional argument, 'category' or 'codes' dictionary-encodes IRI and
+#              language-literal columns (see encode_terms)
+#       dtype_backend: optional argument, 'pyarrow' builds the columns as Arrow arrays
+#              straight from the parsed lexical forms (see _typed_column)
+# callers get their own copy of a cached DataFrame; identical queries already in
+# flight are joined through inflightQueries instead of being sent again
 # ------------------------------------------------------
 #
-def create_dataframe(sparql_endpoint, sparql_query):
-    # run qu0pery
-    result = run_query(sparql_endpoint, sparql_query)  # may throw exception
-    # result is in SPARQL results format refer: https://www.w3.org/TR/sparql11-results-json/
-    cols = result.get('head', {}).get('vars', [])
-    rows = result.get('results', {}).get('bindings', [])
+def create_dataframe(sparql_endpoint, sparql_query, cache=True, fmt=None, terms=None, dtype_backend=None):
+    fmt = fmt.lower() if fmt else 'json'
+    if fmt not in ('json', 'tsv', 'csv', 'xml'):
+        raise ValueError('Unsupported results format for create_dataframe: ' + fmt)
+    _use_arrow(dtype_backend)
+    with measuredQuery('create_dataframe', sparql_endpoint, sparql_query) as metrics:
+        variant = fmt if dtype_backend is None else (fmt, dtype_backend)
+        key = _cache_key('dataframe', sparql_endpoint, sparql_query, variant)
+        df = queryCache.get(key) if cache and key is not None else None
+        if df is not None:
+            metrics['cache'] = 'memory'
+        else:
+            fetch = partial(_fetch_dataframe, sparql_endpoint, sparql_query, key if cache else None, fmt, dtype_backend)
+            df = fetch() if key is None else _join_flight(key, fetch)
+        df = _result_dataframe(df if key is None else df.copy(), terms, dtype_backend)
+        metrics['rows'] = len(df)
+    df.attrs['metrics'] = metrics
+    return df
 
-    # extract types and columnar data for rows
-    coltype = {}
-    nptype = {}
-    coldata = {}
-    for col in cols:
-        coltype[col] = None
-        coldata[col] = []
-        nptype[col] = None
-
-    # for all rows, save (columnar) data in coldata[] for each col
-    for row in rows:
-        for col in cols:
-            cell = row.get(col, None)
-            if cell is None:  # unbound value
-                val = None
-                if coltype[col] in ('byte', 'short', 'int', 'integer', 'float', 'double', 'decimal'):
-                    val = np.nan  # missing numeric values as NaN
-                coldata[col].append(val)
+
+def _result_dataframe(df, terms, dtype_backend):
+    df = encode_terms(df, terms)
+    if _use_arrow(dtype_backend):
+        return arrow_dataframe(df)  # only the term-encoded (and CSV) columns are not Arrow yet
+    return df
+
+
+# True for dtype_backend='pyarrow', False for None
+def _use_arrow(dtype_backend):
+    if dtype_backend is None:
+        return False
+    if dtype_backend != 'pyarrow':
+        raise ValueError('Unsupported dtype_backend: ' + str(dtype_backend))
+    if pyarrow is None:
+        raise ImportError("dtype_backend='pyarrow' requires pyarrow")
+    return True
+
+
+# runs fetch through inflightQueries; a caller that joined a call which was then
+# cancelled by someone else's token retries rather than failing with it
+def _join_flight(key, fetch):
+    while True:
+        try:
+            return inflightQueries.do(key, fetch)
+        except QueryCancelled:
+            token = currentCancelToken()
+            if token is not None and token.cancelled:
+                raise
+
+
+# runs sparql_query and returns (content-type, response bytes)
+# (read queries may be hedged, see EndpointConfig.hedge_after)
+def _fetch_raw(sparql_endpoint, sparql_query, fmt, hedge=False, exclude=(), picked=None):
+    endpoint = getEndpoint(sparql_endpoint)
+    if hedge and endpoint.hedge_after is not None and len(endpoint.replicas) > 1:
+        return _fetch_hedged(endpoint, sparql_query, fmt)
+    started = monotonic()
+    with query_response(endpoint, sparql_query, fmt, exclude, picked) as resp:
+        # content-type header, and actual response data
+        ttfb = monotonic() - started
+        ctype = resp.getheader('content-type', 'text/html').lower()
+        payload = resp.read()
+        recordMetrics(ttfb=ttfb, latency=monotonic() - started, bytes=len(payload))
+        return ctype, payload.lstrip()
+
+
+# sends sparql_query to one replica and, if no response arrived after
+# endpoint.hedge_after seconds, a duplicate to another replica; returns the first
+# successful result and cancels the slower request
+def _fetch_hedged(endpoint, sparql_query, fmt):
+    deadline = currentDeadline()
+    parent = currentCancelToken()
+    outcomes = queue.Queue()
+    picked = []
+    tokens = []
+
+    def attempt(exclude, token):
+        try:
+            with cancellable(token):
+                outcomes.put((True, _fetch_raw(endpoint, sparql_query, fmt, False, exclude, picked)))
+        except BaseException as e:
+            outcomes.put((False, e))
+
+    def start(exclude):
+        tokens.append(CancelToken(parent))
+        ctx = contextvars.copy_context()
+        threading.Thread(target=ctx.run, args=(attempt, exclude, tokens[-1]), daemon=True).start()
+
+    def wait(timeout):
+        if deadline is not None:
+            remaining = deadline.check()
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        try:
+            return outcomes.get(timeout=timeout)
+        except queue.Empty:
+            if deadline is not None and deadline.expired():
+                raise DeadlineExceeded('Query deadline exceeded')
+            return None
+
+    start(())
+    pending = 1
+    try:
+        outcome = wait(endpoint.hedge_after)
+        if outcome is None:
+            start(tuple(picked[:1]))  # hedge to a different replica
+            pending = 2
+        while outcome is None or (not outcome[0] and pending > 1):
+            if outcome is not None:
+                pending -= 1  # first one failed, wait for the other
+            outcome = wait(None)
+    finally:
+        for token in tokens:
+            token.cancel()  # the loser (a finished request no longer holds a connection)
+    if outcome[0]:
+        return outcome[1]
+    raise outcome[1]
+
+
+# runs sparql_query (or loads it from diskCache) and returns its DataFrame,
+# storing it in the caches under key unless key is None
+def _fetch_dataframe(sparql_endpoint, sparql_query, key, fmt='json', dtype_backend=None):
+    disk = diskCache if key is not None else None
+    diskKey = None
+    if disk is not None:
+        variant = fmt if dtype_backend is None else fmt + ' ' + dtype_backend
+        diskKey = DiskCache.key(key[1], key[2] if variant == 'json' else variant + '\n' + key[2])
+    df = disk.get(diskKey) if disk is not None else None
+    if df is not None:
+        recordMetrics(cache='disk')
+    else:
+        if fmt == 'tsv':
+            df = tsv_to_dataframe(_run_query_raw(sparql_endpoint, sparql_query, 'tsv', cache=False)[1], dtype_backend)
+        elif fmt == 'csv':
+            df = csv_to_dataframe(_run_query_raw(sparql_endpoint, sparql_query, 'csv', cache=False)[1])
+        elif fmt == 'xml':
+            started = monotonic()
+            with query_response(sparql_endpoint, sparql_query, 'xml') as resp:
+                parsing = monotonic()
+                reader = _bindings_reader(resp, 'xml')
+                rows = list(reader)
+            # the response is parsed as it is read
+            recordMetrics(ttfb=parsing - started, latency=monotonic() - started, decode_time=monotonic() - parsing)
+            typing = monotonic()
+            df = bindings_to_dataframe(reader.vars or [], rows, dtype_backend)
+            recordMetrics(typing_time=monotonic() - typing)
+        else:
+            # run query
+            ctype, payload = _run_query_raw(sparql_endpoint, sparql_query, cache=False)  # may throw exception
+            if ctype.find('json') < 0:
+                raise ValueError('Expected SPARQL JSON results, got ' + ctype)
+            # result is in SPARQL results format refer: https://www.w3.org/TR/sparql11-results-json/
+            started = monotonic()
+            result = jsonDecoder.lazy(payload)
+            cols = list(result.get('head', {}).get('vars', []))
+            rows = result.get('results', {}).get('bindings', [])
+            typing = monotonic()
+            df = bindings_to_dataframe(cols, rows, dtype_backend)
+            recordMetrics(decode_time=typing - started, typing_time=monotonic() - typing)
+        if disk is not None:
+            disk.put(diskKey, df, key[1], key[2], _query_graphs(key[2]))
+    if key is not None:
+        queryCache.put(key, df, int(df.memory_usage(index=True, deep=True).sum()), _query_graphs(key[2]))
+    return df
+
+
+# ------------------------------------------------------
+# Yields pandas DataFrames of at most chunk_rows rows each, parsing the
+# results.bindings array incrementally from the socket so that memory stays
+# bounded by the chunk size rather than the size of the whole result
+#
+#       sparql_endpoint: 'host:port' ex: '192.168.0.64:7070', 'data.nobelprize.org'
+#       sparql_query: ex: 'select ?s ?p ?o {?s?p?o}'
+#       chunk_rows: number of rows per yielded DataFrame
+#       fmt: optional argument, 'json' (default) or 'xml' results
+#       terms: optional argument, see encode_terms; with 'codes' all chunks share
+#              termDictionary, so codes agree across chunks
+#       dtype_backend: optional argument, see create_dataframe
+# ------------------------------------------------------
+#
+def iter_dataframes(sparql_endpoint, sparql_query, chunk_rows=10000, fmt=None, terms=None, dtype_backend=None):
+    fmt = fmt.lower() if fmt else 'json'
+    _use_arrow(dtype_backend)
+    with query_response(sparql_endpoint, sparql_query, None if fmt == 'json' else fmt) as resp:
+        reader = _bindings_reader(resp, fmt)
+        rows = []
+        emitted = False
+        for row in reader:
+            rows.append(row)
+            # vars is normally known before the first row; if a server sends 'head'
+            # after 'results' the rows are held until it arrives
+            if len(rows) >= chunk_rows and reader.vars is not None:
+                yield _result_dataframe(bindings_to_dataframe(reader.vars, rows, dtype_backend), terms, dtype_backend)
+                emitted = True
+                rows = []
+        if rows or not emitted:
+            yield _result_dataframe(bindings_to_dataframe(reader.vars or [], rows, dtype_backend), terms, dtype_backend)
+
+
+# ------------------------------------------------------
+# Dictionary encoding of term columns: the same IRIs (types, predicates, airports)
+# and language literals repeat across millions of rows, so columns holding only
+# '<iri>' and '"text"@lang' values are replaced by
+#       terms='category': a pandas Categorical of the column's distinct terms
+#       terms='codes': int32 ids into the shared termDictionary (-1 when unbound),
+#                      turned back into terms with termDictionary.decode(codes)
+# any other column, and terms=None, is left as it is
+# ------------------------------------------------------
+#
+class TermDictionary:
+    def __init__(self):
+        self.ids = {}
+        self.terms = []
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.terms)
+
+    # id of term, added when new
+    def id(self, term):
+        tid = self.ids.get(term)
+        if tid is None:
+            with self.lock:
+                tid = self.ids.setdefault(term, len(self.terms))
+                if tid == len(self.terms):
+                    self.terms.append(term)
+        return tid
+
+    # ids of an array of terms; None/NaN (unbound) becomes -1
+    def encode(self, values):
+        codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+        ids = np.fromiter((self.id(term) for term in uniques), dtype=np.int32, count=len(uniques))
+        return np.append(ids, np.int32(-1))[codes]  # factorize gives -1 for unbound
+
+    # terms of an array of ids; -1 becomes None
+    def decode(self, codes):
+        codes = np.asarray(codes)
+        table = np.empty(len(self.terms) + 1, dtype=object)
+        table[:-1] = self.terms
+        return table[codes]  # -1 picks the trailing None
+
+
+termDictionary = TermDictionary()
+_TERM_VALUE = r'<[^>]*>|"[\s\S]*"@[A-Za-z0-9-]+'
+
+
+def encode_terms(df, terms='category'):
+    if terms is None:
+        return df
+    if terms not in ('category', 'codes'):
+        raise ValueError('Unsupported term encoding: ' + str(terms))
+    for col in df.columns:
+        if df[col].dtype != object and not pd.api.types.is_string_dtype(df[col].dtype):
+            continue
+        values = df[col].dropna()
+        if not len(values) or not values.map(type).eq(str).all() or not values.str.fullmatch(_TERM_VALUE).all():
+            continue
+        if terms == 'category':
+            df[col] = df[col].astype('category')
+        else:
+            df[col] = termDictionary.encode(df[col].to_numpy(dtype=object))
+    return df
+
+
+# ------------------------------------------------------
+# Arrow-backed DataFrame: every column that is not Arrow-backed yet is rebuilt as a
+# pyarrow array wrapped in pd.ArrowDtype (strings -> string, datetime64 -> timestamp,
+# numbers and booleans with unbound cells -> nullable Arrow types, Categoricals ->
+# dictionary); create_dataframe builds its columns as Arrow arrays from the start,
+# this converts the term-encoded and CSV columns, or any other DataFrame
+# numeric columns are handed over without copying, and the result converts to an
+# Arrow table (pyarrow.Table.from_pandas, Parquet/Feather export) without copies;
+# object columns mixing Python types Arrow cannot hold are left as they are
+# requires pyarrow
+# ------------------------------------------------------
+#
+def arrow_dataframe(df):
+    if pyarrow is None:
+        raise ImportError("dtype_backend='pyarrow' requires pyarrow")
+    data = {}
+    for col in df.columns:
+        data[col] = _arrow_column(df[col])
+    return pd.DataFrame(data, index=df.index, columns=df.columns)
+
+
+def _arrow_column(series):
+    if isinstance(series.dtype, pd.ArrowDtype):
+        return series
+    values = series.array if isinstance(series.dtype, pd.api.extensions.ExtensionDtype) else series.to_numpy()
+    try:
+        arr = pyarrow.array(values, from_pandas=True)  # NaN/None/NaT -> null
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError, pyarrow.ArrowNotImplementedError):
+        return series
+    return pd.Series(pd.arrays.ArrowExtensionArray(arr), index=series.index, name=series.name)
+
+
+# ------------------------------------------------------
+# Pagination of large SELECT results: the query is split into LIMIT/OFFSET windows
+# over a stable ORDER BY (the query's own, or all result variables when it has
+# none); pages are fetched max_workers at a time and delivered in order
+#
+#       sparql_endpoint: 'host:port' ex: '192.168.0.64:7070', 'data.nobelprize.org'
+#       sparql_query: SELECT query, an existing LIMIT/OFFSET bounds the paged range
+#       page_size: rows per page
+#       max_workers: number of pages fetched in parallel
+#       progress: True prints progress, a callable is called as progress(pages, rows),
+#                 False/None reports nothing
+# ------------------------------------------------------
+#
+def create_dataframe_paged(sparql_endpoint, sparql_query, page_size=100000, max_workers=4, progress=True):
+    pages = list(iter_pages(sparql_endpoint, sparql_query, page_size, max_workers, progress))
+    if len(pages) == 1:
+        return pages[0]
+    return pd.concat(pages, ignore_index=True)
+
+
+def iter_pages(sparql_endpoint, sparql_query, page_size=100000, max_workers=4, progress=True):
+    base, ordered, offset, limit = paginate_query(sparql_query)
+    if not ordered:
+        # no ORDER BY: order by every result variable, learned from an empty probe
+        cols = create_dataframe(sparql_endpoint, base + '\nLIMIT 0').columns
+        if len(cols):
+            base += '\nORDER BY ' + ' '.join('?' + str(col) for col in cols)
+    report = progress if callable(progress) else (_print_progress if progress else None)
+
+    def page_query(page):
+        start = page * page_size
+        size = page_size if limit is None else min(page_size, limit - start)
+        return base + '\nLIMIT ' + str(size) + ' OFFSET ' + str(offset + start)
+
+    npages = None if limit is None else max(1, -(-limit // page_size))
+    parent = currentCancelToken()
+    executor = ThreadPoolExecutor(max_workers=max_workers)
+    inflight = OrderedDict()  # page -> (future, token)
+    nextPage = 0
+    rows = 0
+    done = 0
+
+    def submit():
+        nonlocal nextPage
+        while len(inflight) < max_workers and (npages is None or nextPage < npages):
+            token = CancelToken(parent)
+            ctx = contextvars.copy_context()
+            future = executor.submit(ctx.run, _fetch_page, sparql_endpoint, page_query(nextPage), token)
+            inflight[nextPage] = (future, token)
+            nextPage += 1
+
+    try:
+        submit()
+        while inflight:
+            page, (future, token) = inflight.popitem(last=False)
+            df = future.result()
+            rows += len(df)
+            done += 1
+            last = len(df) < page_size or (npages is not None and page + 1 >= npages)
+            if report is not None:
+                report(done, rows)
+            yield df
+            if last:
+                break
+            submit()
+    finally:
+        for future, token in inflight.values():
+            future.cancel()
+            token.cancel()  # pages past the end of the result
+        executor.shutdown(wait=False)
+        if report is _print_progress:
+            print()
+
+
+def _fetch_page(sparql_endpoint, sparql_query, token):
+    with cancellable(token):
+        return create_dataframe(sparql_endpoint, sparql_query, cache=False)
+
+
+def _print_progress(pages, rows):
+    print('\rfetched %d rows in %d pages' % (rows, pages), end='', flush=True)
+
+
+_SOLUTION_LIMITS = re.compile(r'\b(limit|offset)\s+(\d+)', re.I)
+_ORDER_BY = re.compile(r'\border\s+by\b', re.I)
+
+
+# splits a SELECT query into (query without LIMIT/OFFSET, has ORDER BY, offset, limit)
+def paginate_query(sparql_query):
+    # blank out strings, IRIs and comments so that only query keywords are matched
+    masked = _QUERY_TOKENS.sub(lambda m: ' ' * len(m.group(0)), sparql_query)
+    if not re.match(r'\s*(?:(?:prefix\s+[^\s:]*:\s*|base\s+)\s*)*select\b', masked, re.I):
+        raise ValueError('Only SELECT queries can be paginated')
+    tail = masked.rfind('}') + 1  # solution modifiers follow the outermost group
+    offset, limit = 0, None
+    query = sparql_query
+    for m in reversed(list(_SOLUTION_LIMITS.finditer(masked, tail))):
+        if m.group(1).lower() == 'limit':
+            limit = int(m.group(2))
+        else:
+            offset = int(m.group(2))
+        query = query[:m.start()] + query[m.end():]
+    ordered = _ORDER_BY.search(masked, tail) is not None
+    return query.rstrip(), ordered, offset, limit
+
+
+# ------------------------------------------------------
+# asyncio client: run_query_async / create_dataframe_async run the blocking
+# client on a shared thread pool (over the same pooled keep-alive connections),
+# so an event loop (notebook cell, async Dash callback) can overlap round-trips
+# ------------------------------------------------------
+#
+queryExecutor = None
+_executorLock = threading.Lock()
+
+
+def getQueryExecutor(max_workers=16):
+    global queryExecutor
+    with _executorLock:
+        if queryExecutor is None:
+            queryExecutor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='sparql')
+        return queryExecutor
+
+
+# runs func(*args, **kwargs) on the query executor in a copy of the caller's context
+async def _run_async(func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(getQueryExecutor(), partial(ctx.run, func, *args, **kwargs))
+
+
+async def run_query_async(sparql_endpoint, sparql_query, fmt=None, cache=True):
+    return await _run_async(run_query, sparql_endpoint, sparql_query, fmt, cache)
+
+
+async def create_dataframe_async(sparql_endpoint, sparql_query, cache=True, fmt=None, terms=None, dtype_backend=None):
+    return await _run_async(create_dataframe, sparql_endpoint, sparql_query, cache, fmt, terms, dtype_backend)
+
+
+# ------------------------------------------------------
+# Runs many independent queries against one endpoint concurrently and returns
+# their results in the order of queries (like asyncio.gather)
+#
+#       sparql_endpoint: 'host:port' ex: '192.168.0.64:7070', 'data.nobelprize.org'
+#       sparql_queries: iterable of query strings
+#       concurrency: max number of queries in flight at once
+#       fmt: None returns DataFrames (create_dataframe), otherwise raw run_query results
+#       return_exceptions: as for asyncio.gather
+#       cache: as for create_dataframe / run_query
+#       results_fmt, terms, dtype_backend: passed to create_dataframe as fmt, terms and
+#              dtype_backend when fmt is None
+# ------------------------------------------------------
+#
+async def gather_queries(sparql_endpoint, sparql_queries, concurrency=8, fmt=None, return_exceptions=False,
+                         cache=True, results_fmt=None, terms=None, dtype_backend=None):
+    limit = asyncio.Semaphore(concurrency)
+
+    async def one(sparql_query):
+        async with limit:
+            if fmt is None:
+                return await create_dataframe_async(sparql_endpoint, sparql_query, cache, results_fmt,
+                                                    terms, dtype_backend)
+            return await run_query_async(sparql_endpoint, sparql_query, fmt, cache)
+
+    return await asyncio.gather(*[one(q) for q in sparql_queries], return_exceptions=return_exceptions)
+
+
+# ------------------------------------------------------
+# Incremental reader for the SPARQL1.1 JSON results format; iterating yields the
+# binding dicts of results.bindings one at a time while reading stream in chunks,
+# head.vars is available in .vars as soon as it has been read
+# ------------------------------------------------------
+#
+class JsonBindingsReader:
+    _ws = re.compile(r'[ \t\n\r]*')
+
+    def __init__(self, stream, chunk_size=1 << 16):
+        self.vars = None
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._json = json.JSONDecoder()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+
+    def __iter__(self):
+        self._expect('{')
+        for key in self._members():
+            if key == 'head':
+                self.vars = self._value().get('vars', [])
+            elif key == 'results':
+                self._expect('{')
+                for rkey in self._members():
+                    if rkey == 'bindings':
+                        for row in self._elements():
+                            yield row
+                    else:
+                        self._value()
+            else:
+                self._value()  # 'boolean', 'link', ...
+
+    # read next chunk of the stream, dropping the consumed part of the buffer
+    def _fill(self):
+        if self._eof:
+            raise ValueError('Unexpected end of SPARQL JSON results')
+        chunk = self._stream.read(self._chunk_size)
+        self._eof = not chunk
+        self._buf = self._buf[self._pos:] + self._utf8.decode(chunk, final=self._eof)
+        self._pos = 0
+
+    # skip whitespace and return the next significant character
+    def _peek(self):
+        while True:
+            self._pos = self._ws.match(self._buf, self._pos).end()
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            self._fill()
+
+    def _expect(self, ch):
+        if self._peek() != ch:
+            raise ValueError('Malformed SPARQL JSON results: expected ' + ch)
+        self._pos += 1
+
+    # decode one complete JSON value at the current position
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                val, end = self._json.raw_decode(self._buf, self._pos)
+            except ValueError:
+                if self._eof:
+                    raise
+                self._fill()
+                continue
+            if end < len(self._buf) or self._eof:
+                self._pos = end
+                return val
+            self._fill()  # a number/literal ending the buffer may be cut short
+
+    # object members: yields each key with the position left at its value
+    def _members(self):
+        if self._peek() == '}':
+            self._pos += 1
+            return
+        while True:
+            key = self._value()
+            self._expect(':')
+            yield key
+            if self._peek() == ',':
+                self._pos += 1
+                continue
+            self._expect('}')
+            return
+
+    # array elements, decoded one at a time
+    def _elements(self):
+        self._expect('[')
+        if self._peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self._value()
+            if self._peek() == ',':
+                self._pos += 1
+                continue
+            self._expect(']')
+            return
+
+
+# returns the streaming reader for resp in fmt ('json' or 'xml'), checking its content-type
+def _bindings_reader(resp, fmt):
+    ctype = resp.getheader('content-type', 'text/html').lower()
+    if fmt == 'xml':
+        if ctype.find('xml') < 0:
+            raise Exception('Query Error', 'expected SPARQL XML results, got ' + ctype)
+        return XmlBindingsReader(resp)
+    if fmt != 'json':
+        raise ValueError('Unsupported streaming results format: ' + fmt)
+    if ctype.find('json') < 0:
+        raise Exception('Query Error', 'expected SPARQL JSON results, got ' + ctype)
+    return JsonBindingsReader(resp)
+
+
+# ------------------------------------------------------
+# Incremental reader for the SPARQL XML results format
+# (refer: https://www.w3.org/TR/rdf-sparql-XMLres/); iterating yields each
+# <result> as a binding dict of the JSON format ({'type', 'value', 'datatype',
+# 'xml:lang'}), so it feeds the same DataFrame construction as JsonBindingsReader;
+# processed elements are cleared so memory does not grow with the result
+# ------------------------------------------------------
+#
+class XmlBindingsReader:
+    _ns = '{http://www.w3.org/2005/sparql-results#}'
+    _lang = '{http://www.w3.org/XML/1998/namespace}lang'
+
+    def __init__(self, stream):
+        self.vars = None
+        self._stream = stream
+
+    def __iter__(self):
+        ns = self._ns
+        variables = []
+        results = None
+        for event, elem in ET.iterparse(self._stream, events=('start', 'end')):
+            if event == 'start':
+                if elem.tag == ns + 'results':
+                    results = elem
+                continue
+            if elem.tag == ns + 'result':
+                row = {}
+                for binding in elem:
+                    term = binding[0] if len(binding) else None
+                    if term is None:
+                        continue
+                    cell = {'type': term.tag[len(ns):], 'value': term.text or ''}
+                    if term.get('datatype') is not None:
+                        cell['datatype'] = term.get('datatype')
+                    if term.get(self._lang) is not None:
+                        cell['xml:lang'] = term.get(self._lang)
+                    row[binding.get('name')] = cell
+                elem.clear()
+                if results is not None:
+                    results.clear()  # drop the processed <result> from the tree
+                yield row
+            elif elem.tag == ns + 'variable':
+                variables.append(elem.get('name'))
+            elif elem.tag == ns + 'head':
+                self.vars = variables
+                elem.clear()
+
+
+# ------------------------------------------------------
+# Incremental N-Triples (and Turtle subset) reader for CONSTRUCT/DESCRIBE results:
+# iterating yields (s, p, o) term tuples while the stream is read in chunks, so
+# memory does not grow with the response
+# terms are N-Triples strings: IRIs as '<iri>' (prefixed names and 'a' expanded),
+# blank nodes as '_:id', literals as '"lexical"', '"lexical"@lang' or
+# '"lexical"^^<datatype>' with escapes resolved (see split_literal)
+# whole N-Triples lines are matched in one go; anything else goes through the Turtle
+# tokenizer: @prefix/PREFIX, @base/BASE, ';' and ',' lists, long strings, numbers
+# and booleans (blank node property lists and collections are not supported)
+# ------------------------------------------------------
+#
+class TripleReader:
+    _ntriple = re.compile(r'(?:[ \t]*(?:#[^\n]*)?\r?\n)*[ \t]*(<[^<>"\s]*>|_:\S+)[ \t]+(<[^<>"\s]*>)[ \t]+'
+                          r'(<[^<>"\s]*>|_:\S+|"(?:[^"\\\n]|\\.)*"(?:@[A-Za-z0-9-]+|\^\^<[^<>"\s]*>)?)'
+                          r'[ \t]*\.[ \t]*(?:#[^\n]*)?\r?\n')
+    _token = re.compile(r'''(?P<ws>(?:\s|\#[^\n]*(?:\n|$))+)
+        |(?P<iri><[^<>"\s]*>)
+        |(?P<long>"""(?:[^"\\]|\\.|"(?!""))*"""|\'\'\'(?:[^'\\]|\\.|'(?!''))*\'\'\')
+        |(?P<string>"(?:[^"\\\n]|\\.)*"|'(?:[^'\\\n]|\\.)*')
+        |(?P<directive>@(?:prefix|base)\b)
+        |(?P<lang>@[A-Za-z]+(?:-[A-Za-z0-9]+)*)
+        |(?P<dt>\^\^)
+        |(?P<bnode>_:[A-Za-z0-9_](?:[\w.-]*[\w-])?)
+        |(?P<double>[+-]?(?:\d+\.\d*[eE][+-]?\d+|\.\d+[eE][+-]?\d+|\d+[eE][+-]?\d+))
+        |(?P<decimal>[+-]?\d*\.\d+)
+        |(?P<integer>[+-]?\d+)
+        |(?P<pname>(?:[A-Za-z][\w.-]*)?:(?:[^\s;,()\[\]"'<>]*[^\s;,.()\[\]"'<>])?)
+        |(?P<word>[A-Za-z]+)
+        |(?P<punct>[.;,\[\]()])''', re.X)
+
+    def __init__(self, stream, chunk_size=1 << 16):
+        self.prefixes = {}
+        self.base = None
+        self._stream = stream
+        self._chunk_size = chunk_size
+        self._utf8 = codecs.getincrementaldecoder('utf-8')()
+        self._buf = ''
+        self._pos = 0
+        self._eof = False
+        self._pending = None
+
+    def __iter__(self):
+        subject = predicate = None
+        state = 'subject'
+        while True:
+            if state == 'subject' and self._pending is None:
+                triple = self._line()
+                if triple is not None:
+                    yield triple
+                    continue
+            token = self._next()
+            kind, text = token if token is not None else (None, None)
+            if kind == 'punct' and text in '[]()':
+                raise ValueError('Unsupported Turtle syntax: ' + text)
+            if state == 'subject':
+                if token is None:
+                    return
+                if kind == 'directive' or (kind == 'word' and text.upper() in ('PREFIX', 'BASE')):
+                    self._directive(text)
+                    continue
+                subject = self._term(kind, text)
+                state = 'predicate'
+            elif state == 'predicate':
+                if kind == 'punct' and text == '.':
+                    state = 'subject'  # after a trailing ';'
+                    continue
+                predicate = _RDF_TYPE if (kind, text) == ('word', 'a') else self._term(kind, text)
+                state = 'object'
+            elif state == 'object':
+                yield subject, predicate, self._term(kind, text)
+                state = 'separator'
+            elif kind == 'punct' and text in '.;,':
+                state = {'.': 'subject', ';': 'predicate', ',': 'object'}[text]
+            else:
+                raise ValueError('Malformed triples: expected ".", ";" or ","')
+
+    # a complete N-Triples line at the current position, None when it is not one
+    def _line(self):
+        while True:
+            m = self._ntriple.match(self._buf, self._pos)
+            if m is not None:
+                self._pos = m.end()
+                s, p, o = m.groups()
+                if '\\' in m.group(0):
+                    s, p = self._unescape_iri(s), self._unescape_iri(p)
+                    o = self._unescape_iri(o) if o[0] == '<' else self._literal(o) if o[0] == '"' else o
+                return s, p, o
+            newline = self._buf.find('\n', self._pos)
+            if newline >= 0 or self._eof:
+                return None  # not N-Triples (or a partial statement), use the tokenizer
+            self._fill()
+
+    # read next chunk of the stream, dropping the consumed part of the buffer
+    def _fill(self):
+        chunk = self._stream.read(self._chunk_size)
+        self._eof = not chunk
+        self._buf = self._buf[self._pos:] + self._utf8.decode(chunk, final=self._eof)
+        self._pos = 0
+
+    # next significant (kind, text) token, None at the end of the stream
+    def _next(self):
+        if self._pending is not None:
+            token, self._pending = self._pending, None
+            return token
+        while True:
+            m = self._token.match(self._buf, self._pos)
+            # a token (close to) the end of the buffer may be cut short ('1.5e+3' read
+            # as '1'), and an empty string followed by a quote is an unterminated long string
+            if (m is None or m.end() > len(self._buf) - 4 or m.group(0) in ('""', "''") and
+                    self._buf.startswith(m.group(0)[0], m.end())) and not self._eof:
+                self._fill()
                 continue
-            # compute type and datum
-            pdval = cell.get('value', '')
-            vtype = cell.get('type', '')
-            langtag = cell.get('xml:lang', '')
-            typeuri = cell.get('datatype', '')
-            pdtype = 'object'
-            if vtype == 'uri':
-                pdval = '<' + pdval + '>'
-            elif langtag != '':
-                pdval = '"' + pdval + '"@' + langtag
-                coltype[col] = 'object'
-            elif typeuri != '':
-                # vtype in ('typed-literal')
-                typeuri = typeuri.replace('http://www.w3.org/2001/XMLSchema#', '')
-                coltype[col] = typeuri if (coltype[col] is None or coltype[col] == typeuri) else 'object'
-                pdtype, pdval = typed_value(typeuri, pdval)
-            nptype[col] = pdtype if (coltype[col] != 'object') else 'object'
-            coldata[col].append(pdval)  # columnar data
+            if m is None:
+                if self._pos < len(self._buf):
+                    raise ValueError('Malformed triples near: ' + self._buf[self._pos:self._pos + 40])
+                return None
+            self._pos = m.end()
+            if m.lastgroup != 'ws':
+                return m.lastgroup, m.group(0)
+
+    def _expect(self, kind):
+        token = self._next()
+        if token is None or token[0] != kind:
+            raise ValueError('Malformed triples: expected ' + kind)
+        return token[1]
+
+    def _directive(self, keyword):
+        if keyword.lower() in ('@prefix', 'prefix'):
+            prefix = self._expect('pname')
+            self.prefixes[prefix[:-1]] = self._term('iri', self._expect('iri'))[1:-1]
+        else:
+            self.base = self._term('iri', self._expect('iri'))[1:-1]
+        if keyword.startswith('@'):
+            self._expect('punct')
+
+    def _term(self, kind, text):
+        if kind == 'iri':
+            iri = self._unescape_iri(text)[1:-1]
+            if self.base is not None and not _ABSOLUTE_IRI_PREFIX.match(iri):
+                iri = urljoin(self.base, iri)
+            return '<' + iri + '>'
+        if kind == 'pname':
+            prefix, local = text.split(':', 1)
+            if prefix not in self.prefixes:
+                raise ValueError('Undefined prefix: ' + prefix)
+            return '<' + self.prefixes[prefix] + re.sub(r'\\(.)', r'\1', local) + '>'
+        if kind == 'bnode':
+            return text
+        if kind in ('string', 'long'):
+            quote = 3 if kind == 'long' else 1
+            lexical = _unescape_turtle(text[quote:-quote])
+            suffix = self._next()
+            if suffix is not None and suffix[0] == 'lang':
+                return '"' + lexical + '"' + suffix[1]
+            if suffix is not None and suffix[0] == 'dt':
+                token = self._next()
+                if token is None or token[0] not in ('iri', 'pname'):
+                    raise ValueError('Malformed triples: expected a datatype')
+                return '"' + lexical + '"^^' + self._term(*token)
+            self._pending = suffix
+            return '"' + lexical + '"'
+        if kind in ('integer', 'decimal', 'double'):
+            return '"' + text + '"^^<' + _XSD + kind + '>'
+        if kind == 'word' and text in ('true', 'false'):
+            return '"' + text + '"^^<' + _XSD + 'boolean>'
+        raise ValueError('Malformed triples: unexpected ' + (text or 'end of input'))
+
+    @staticmethod
+    def _unescape_iri(iri):
+        return _unescape_turtle(iri) if '\\' in iri else iri
+
+    # an N-Triples literal with escapes resolved
+    @staticmethod
+    def _literal(term):
+        end = term.rindex('"')
+        return '"' + _unescape_turtle(term[1:end]) + term[end:]
+
+
+_ABSOLUTE_IRI_PREFIX = re.compile(r'[A-Za-z][A-Za-z0-9+.-]*:')
+
+
+# (lexical, language, datatype IRI) of a literal term from TripleReader,
+# None for a term that is not a literal
+def split_literal(term):
+    if not term.startswith('"'):
+        return None
+    end = term.rindex('"')
+    suffix = term[end + 1:]
+    if suffix.startswith('@'):
+        return term[1:end], suffix[1:], None
+    if suffix.startswith('^^'):
+        return term[1:end], None, suffix[3:-1]
+    return term[1:end], None, None
+
+
+# ------------------------------------------------------
+# Runs a CONSTRUCT/DESCRIBE sparql_query and yields its (s, p, o) triples as they
+# are read from the response (see TripleReader)
+#       sparql_endpoint: 'host:port' ex: '192.168.0.64:7070', 'data.nobelprize.org'
+#       sparql_query: ex: 'construct {?s ?p ?o} {?s ?p ?o}'
+# ------------------------------------------------------
+#
+def iter_triples(sparql_endpoint, sparql_query, chunk_size=1 << 16):
+    with query_response(sparql_endpoint, sparql_query, 'nt') as resp:
+        ctype = resp.getheader('content-type', 'text/html').lower()
+        if ctype.find('sparql-results') >= 0:
+            raise Exception('Query Error', 'expected RDF triples, got ' + ctype)
+        for triple in TripleReader(resp, chunk_size):
+            yield triple
+
+
+# ------------------------------------------------------
+# Compact in-memory triple store: terms are interned in a TermDictionary and triples
+# kept as int32 (s, p, o) id rows, sorted and deduplicated, with SPO, POS and OSP
+# indexes so that any pattern of bound terms is answered by binary search
+#       add(triples): adds (s, p, o) term tuples, returns their id rows
+#       match(s, p, o): id rows matching the bound terms (None is a wildcard)
+#       triples(s, p, o) / objects(s, p) / subjects(p, o): the same as terms
+#       remove(s, p, o) / discard(triples): drops matching triples
+# added triples are merged (and indexes rebuilt) on the next lookup
+# ------------------------------------------------------
+#
+_RDF_TYPE = '<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>'
+
+
+class TripleStore:
+    # index used for each combination of bound (s, p, o): columns in sort order
+    _orders = {(False, False, False): (0, 1, 2), (True, False, False): (0, 1, 2),
+               (True, True, False): (0, 1, 2), (True, True, True): (0, 1, 2),
+               (False, True, False): (1, 2, 0), (False, True, True): (1, 2, 0),
+               (False, False, True): (2, 0, 1), (True, False, True): (2, 0, 1)}
+
+    def __init__(self, terms=None):
+        self.terms = terms if terms is not None else TermDictionary()
+        self.lock = threading.RLock()
+        self._spo = np.empty((0, 3), dtype=np.int32)
+        self._pending = []
+        self._indexes = {}
+
+    def __len__(self):
+        with self.lock:
+            self._merge()
+            return len(self._spo)
+
+    def clear(self):
+        with self.lock:
+            self._spo = np.empty((0, 3), dtype=np.int32)
+            self._pending = []
+            self._indexes = {}
+
+    def add(self, triples):
+        termId = self.terms.id
+        ids = np.fromiter((termId(term) for triple in triples for term in triple), dtype=np.int32)
+        ids = np.unique(ids.reshape(-1, 3), axis=0)
+        if len(ids):
+            with self.lock:
+                self._pending.append(ids)
+                self._indexes = {}
+        return ids
+
+    def match(self, s=None, p=None, o=None):
+        with self.lock:
+            positions = self._positions(s, p, o)
+            return self._spo[positions]
+
+    def triples(self, s=None, p=None, o=None):
+        return self.decode(self.match(s, p, o))
+
+    def objects(self, s=None, p=None):
+        terms = self.terms.terms
+        return [terms[i] for i in self.match(s, p)[:, 2].tolist()]
+
+    def subjects(self, p=None, o=None):
+        terms = self.terms.terms
+        return [terms[i] for i in self.match(None, p, o)[:, 0].tolist()]
+
+    # (s, p, o) term tuples of id rows
+    def decode(self, ids):
+        terms = self.terms.terms
+        return [(terms[s], terms[p], terms[o]) for s, p, o in np.asarray(ids).tolist()]
+
+    def remove(self, s=None, p=None, o=None):
+        with self.lock:
+            positions = self._positions(s, p, o)
+            if len(positions):
+                self._spo = np.delete(self._spo, positions, axis=0)
+                self._indexes = {}
+            return len(positions)
+
+    def discard(self, triples):
+        with self.lock:
+            return sum(self.remove(s, p, o) for s, p, o in triples)
+
+    def _merge(self):
+        if self._pending:
+            self._spo = np.unique(np.concatenate([self._spo] + self._pending), axis=0)
+            self._pending = []
+            self._indexes = {}
+
+    # (rows sorted by order with columns in that order, their positions in _spo)
+    def _index(self, order):
+        index = self._indexes.get(order)
+        if index is None:
+            if order == (0, 1, 2):
+                index = (self._spo, np.arange(len(self._spo)))  # _spo is kept in SPO order
+            else:
+                rows = self._spo[:, order]
+                perm = np.lexsort((rows[:, 2], rows[:, 1], rows[:, 0]))
+                index = (rows[perm], perm)
+            self._indexes[order] = index
+        return index
+
+    # positions in _spo of the triples matching the bound terms
+    def _positions(self, s, p, o):
+        self._merge()
+        key = (s, p, o)
+        ids = [None if term is None else self.terms.ids.get(term, -1) for term in key]
+        if -1 in ids:
+            return np.empty(0, dtype=np.intp)  # a term never seen
+        order = self._orders[tuple(term is not None for term in key)]
+        rows, perm = self._index(order)
+        lo, hi = 0, len(rows)
+        for col, pos in enumerate(order):
+            if ids[pos] is None:
+                break
+            column = rows[lo:hi, col]
+            lo, hi = lo + np.searchsorted(column, ids[pos], 'left'), lo + np.searchsorted(column, ids[pos], 'right')
+        return perm[lo:hi]
+
+
+# ------------------------------------------------------
+# Builds a pandas DataFrame from SPARQL JSON bindings
+# the raw lexical forms and datatypes of each column are collected first, then the
+# column is converted as a whole (see _typed_column); only columns mixing datatypes
+# are typed cell by cell
+#       cols: result variables (head.vars)
+#       rows: iterable of binding dicts (results.bindings)
+#       dtype_backend: optional argument, 'pyarrow' builds Arrow-backed columns
+# ------------------------------------------------------
+#
+def bindings_to_dataframe(cols, rows, dtype_backend=None):
+    rows = rows if isinstance(rows, list) else list(rows)
+    arrow = _use_arrow(dtype_backend)
     # instantiate DataFrame
     npdata = {}
     for col in cols:
-        npdata[col] = np.array(coldata[col], dtype=np.dtype(nptype[col]))
+        lexicals, datatypes = _binding_column(rows, col)
+        npdata[col] = _typed_column(lexicals, datatypes, datatypes != None, arrow)  # noqa: E711, elementwise
     return pd.DataFrame(columns=cols, data=npdata)
 
 
+_xsdNames = {}  # datatype IRI -> code used by _typed_column (xsd local name)
+
+
+# lexical forms and datatype codes (None when unbound) of column col
+def _binding_column(rows, col):
+    lexicals = np.empty(len(rows), dtype=object)
+    datatypes = np.empty(len(rows), dtype=object)
+    terms = {}  # repeated IRIs/language literals share one string object
+    for i, row in enumerate(rows):
+        cell = row.get(col)
+        if cell is None:  # unbound value
+            continue
+        value = cell.get('value', '')
+        if cell.get('type') == 'uri':
+            term = terms.get(value)
+            if term is None:
+                term = terms[value] = '<' + value + '>'
+            lexicals[i] = term
+            datatypes[i] = 'uri'
+        elif cell.get('xml:lang'):
+            term = '"' + value + '"@' + cell['xml:lang']
+            lexicals[i] = terms.setdefault(term, term)
+            datatypes[i] = 'lang'
+        elif cell.get('datatype'):
+            typeuri = cell['datatype']
+            code = _xsdNames.get(typeuri)
+            if code is None:
+                code = _xsdNames[typeuri] = typeuri.replace(_XSD, '')
+            lexicals[i] = value
+            datatypes[i] = code
+        else:
+            lexicals[i] = value
+            datatypes[i] = 'bnode' if cell.get('type') == 'bnode' else ''
+    return lexicals, datatypes
+
+
 # util: convert literal val into typed-value based on the typeuri
+# (a datatype local name for xsd types, the datatype IRI otherwise); returns
+# (dtype, value), or ('object', val) for datatypes without a converter
 def typed_value(typeuri, val):
-    # {"duration", ColTypeDuration},
-    if typeuri in ('boolean'):
-        return np.bool, 'true' == val
-    elif typeuri in ('byte'):
-        return np.byte, np.int8(val)
-    elif typeuri in ('short'):
-        return np.short, np.short(val)
-    elif typeuri in ('integer', 'int', 'nonNegativeInteger'):
-        return np.intc, np.int(val)
-    elif typeuri in ('long'):
-        return np.int_, np.int_(val)
-    elif typeuri in ('float'):
-        return np.single, np.float32(val)
-    elif typeuri in ('double', 'decimal'):
-        return np.double, np.float64(val)
-    elif typeuri in ('dateTime'):
-        return np.datetime64, datetime.fromisoformat(val)
-    elif typeuri in ('date'):
-        return pd.date, date.fromisoformat(val)
-    elif typeuri in ('time'):
-        return pd.time, time.fromisoformat(val)
-    return 'object', val
+    values = convert_column(typeuri, [val])
+    if values is None:
+        return 'object', val
+    return values.dtype, values[0]
+
+
+# ------------------------------------------------------
+# Datatype converter registry: maps a datatype (xsd local name, or the IRI of any
+# other datatype) to a converter called with a numpy object array of lexical forms
+# that returns the whole converted column, optionally cast to dtype
+# converters raise ValueError/TypeError/OverflowError for values they cannot
+# convert, the column then keeps its lexical forms
+# integer and floating dtypes take part in numeric widening of mixed columns
+#       register_datatype('http://example.org/dt#celsius', lambda v: pd.to_numeric(v), np.double)
+# ------------------------------------------------------
+#
+_XSD = 'http://www.w3.org/2001/XMLSchema#'
+datatypeConverters = {}
+
+
+def register_datatype(typeuri, converter, dtype=None):
+    datatypeConverters[typeuri.replace(_XSD, '')] = (converter, None if dtype is None else np.dtype(dtype))
+
+
+def unregister_datatype(typeuri):
+    datatypeConverters.pop(typeuri.replace(_XSD, ''), None)
+
+
+# Vectorized counterpart of typed_value: converts a whole column of lexical forms
+# of one datatype at once, returns None for datatypes it has no converter for
+# (or when a value does not parse), in which case callers type cells one by one
+def convert_column(typeuri, lexicals):
+    entry = datatypeConverters.get(typeuri)
+    if entry is None:
+        return None
+    converter, dtype = entry
+    try:
+        values = converter(np.asarray(lexicals, dtype=object))
+        return np.asarray(values) if dtype is None else np.asarray(values, dtype=dtype)
+    except (ValueError, TypeError, OverflowError):
+        return None
+
+
+def _is_numeric(typeuri):
+    entry = datatypeConverters.get(typeuri)
+    return entry is not None and entry[1] is not None and entry[1].kind in 'iuf'
+
+
+def _to_boolean(lexicals):
+    if not np.isin(lexicals, ('true', 'false', '1', '0')).all():
+        raise ValueError('Invalid xsd:boolean')
+    return (lexicals == 'true') | (lexicals == '1')
+
+
+# integers are range checked rather than wrapped around
+def _integer_converter(dtype):
+    info = np.iinfo(dtype)
+
+    def convert(lexicals):
+        values = pd.to_numeric(lexicals)
+        if values.dtype.kind not in 'iu':
+            raise ValueError('Invalid integer literal')
+        if len(values) and (values.min() < info.min or values.max() > info.max):
+            raise OverflowError('Integer literal out of range')
+        return values
+    return convert
+
+
+def _to_float(lexicals):
+    return pd.to_numeric(np.where(lexicals == 'INF', 'inf', np.where(lexicals == '-INF', '-inf', lexicals)))
+
+
+# format='ISO8601' needs pandas 2.0, older versions read it as a strptime pattern
+_ISO8601_FORMAT = 'ISO8601' if int(pd.__version__.split('.')[0]) >= 2 else None
+
+
+# offsets are converted to UTC and dropped, as numpy does for aware datetimes
+def _to_datetime64(lexicals):
+    stamps = pd.to_datetime(lexicals, utc=True, format=_ISO8601_FORMAT)
+    return np.asarray(stamps.tz_localize(None), dtype='datetime64[ns]')
+
+
+def _to_gyear_month(lexicals):
+    return np.asarray(pd.to_datetime(lexicals, format='%Y-%m'), dtype='datetime64[ns]')
+
+
+def _to_duration(lexicals):
+    return np.asarray(pd.to_timedelta(lexicals), dtype='timedelta64[ns]')
+
+
+for _names, _dtype in ((('byte',), np.int8), (('short',), np.int16), (('int', 'gYear'), np.int32),
+                       (('long', 'integer', 'nonNegativeInteger', 'nonPositiveInteger',
+                         'positiveInteger', 'negativeInteger'), np.int64),
+                       (('unsignedByte',), np.uint8), (('unsignedShort',), np.uint16),
+                       (('unsignedInt',), np.uint32), (('unsignedLong',), np.uint64)):
+    for _name in _names:
+        register_datatype(_name, _integer_converter(_dtype), _dtype)
+register_datatype('float', _to_float, np.single)
+register_datatype('double', _to_float, np.double)
+register_datatype('decimal', pd.to_numeric, np.double)
+register_datatype('boolean', _to_boolean, np.bool_)
+register_datatype('dateTime', _to_datetime64, 'datetime64[ns]')
+register_datatype('dateTimeStamp', _to_datetime64, 'datetime64[ns]')
+register_datatype('gYearMonth', _to_gyear_month, 'datetime64[ns]')
+register_datatype('date', lambda lexicals: [date.fromisoformat(v) for v in lexicals], object)
+register_datatype('time', lambda lexicals: [time.fromisoformat(v) for v in lexicals], object)
+register_datatype('duration', _to_duration, 'timedelta64[ns]')  # day-time durations only
+register_datatype('dayTimeDuration', _to_duration, 'timedelta64[ns]')
+
+
+# ------------------------------------------------------
+# Builds one DataFrame column from parallel arrays of lexical forms and datatype
+# codes: 'uri', 'bnode', 'lang' and '' (plain literal) keep their lexical form,
+# any other code is an xsd datatype (local name) or datatype IRI
+# types are resolved once the whole column is known: a column whose bound cells
+# share one datatype is converted as a whole, numeric datatypes are widened to a
+# common type (int -> long -> double), and numeric/boolean columns with unbound
+# cells use pandas' nullable dtypes (Int64, Float64, boolean...) rather than
+# object; only columns mixing other datatypes are typed cell by cell
+# with arrow the column is built as a pyarrow array instead, unbound cells masked
+# out as nulls (strings, numbers, booleans, timestamps, durations)
+# ------------------------------------------------------
+#
+_LEXICAL_KINDS = ('uri', 'bnode', 'lang', '')
+
+
+def _typed_column(lexicals, datatypes, bound, arrow=False):
+    kinds = pd.unique(datatypes[bound])
+    if all(kind in _LEXICAL_KINDS for kind in kinds):
+        if arrow:
+            return _arrow_array(lexicals, bound, pyarrow.large_string())
+        column = lexicals.copy()  # IRIs, blank nodes and plain/language literals as they are
+        column[~bound] = None
+        return column
+    values = _convert_kinds(kinds, lexicals, datatypes, bound)
+    if values is not None and arrow:
+        data = values
+        if not bound.all():
+            data = np.zeros(len(bound), dtype=values.dtype)  # placeholders under the null mask
+            data[bound] = values
+        column = _arrow_array(data, bound)
+        if column is not None:
+            return column
+    if values is not None and bound.all():
+        return values
+    if values is not None and values.dtype.kind in 'biuf':
+        return _nullable_column(values, bound)
+    if values is not None and values.dtype.kind in 'mM':
+        column = np.full(len(lexicals), values.dtype.type('NaT'), dtype=values.dtype)
+        column[bound] = values
+        return column
+    column = np.empty(len(lexicals), dtype=object)
+    for i in np.flatnonzero(bound):
+        dt = datatypes[i]
+        if dt in _LEXICAL_KINDS:
+            column[i] = lexicals[i]
+        else:
+            try:
+                column[i] = typed_value(dt, lexicals[i])[1]
+            except (ValueError, TypeError, OverflowError):
+                column[i] = lexicals[i]
+    if arrow:
+        converted = _arrow_array(column, bound)
+        if converted is not None:
+            return converted
+    return column
+
+
+# Arrow-backed array of data, with the cells that are not bound as nulls; None for
+# object data mixing Python types Arrow cannot hold in one column
+def _arrow_array(data, bound, type=None):
+    try:
+        return pd.arrays.ArrowExtensionArray(pyarrow.array(data, type=type, mask=None if bound.all() else ~bound))
+    except (pyarrow.ArrowInvalid, pyarrow.ArrowTypeError, pyarrow.ArrowNotImplementedError):
+        return None
+
+
+# values of the bound cells converted to one dtype, None when the datatypes do not
+# share one (or a value does not parse)
+def _convert_kinds(kinds, lexicals, datatypes, bound):
+    if len(kinds) == 1:
+        return convert_column(kinds[0], lexicals[bound])
+    if not all(_is_numeric(kind) for kind in kinds):
+        return None
+    parts = []
+    for kind in kinds:
+        part = convert_column(kind, lexicals[bound & (datatypes == kind)])
+        if part is None:
+            return None
+        parts.append((kind, part))
+    values = np.empty(int(bound.sum()), dtype=np.result_type(*[part.dtype for kind, part in parts]))
+    boundTypes = datatypes[bound]
+    for kind, part in parts:
+        values[boundTypes == kind] = part
+    return values
+
+
+def _nullable_column(values, bound):
+    data = np.zeros(len(bound), dtype=values.dtype)
+    data[bound] = values
+    if values.dtype.kind == 'b':
+        return pd.arrays.BooleanArray(data, ~bound)
+    if values.dtype.kind in 'iu':
+        return pd.arrays.IntegerArray(data, ~bound)
+    return pd.arrays.FloatingArray(data, ~bound)
+
+
+# ------------------------------------------------------
+# SPARQL 1.1 TSV results into a pandas DataFrame
+# (refer: https://www.w3.org/TR/sparql11-results-csv-tsv/)
+# TSV cells are RDF terms in Turtle syntax, so IRIs (as '<...>') and datatypes
+# survive; the payload is split by pandas' C parser and each column is decomposed
+# with vectorized string operations and typed like create_dataframe does
+# ------------------------------------------------------
+#
+_TSV_LITERAL = r'^"(?P<lex>(?:[^"\\]|\\.)*)"(?:@(?P<lang>[A-Za-z0-9-]+)|\^\^<(?P<dt>[^>]*)>)?$'
+_TURTLE_NUMBERS = (('integer', r'[+-]?\d+'),
+                   ('decimal', r'[+-]?\d*\.\d+'),
+                   ('double', r'[+-]?(?:\d+\.\d*|\.?\d+)[eE][+-]?\d+'),
+                   ('boolean', r'true|false'))
+_TURTLE_ESCAPES = re.compile(r'\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))')
+_TURTLE_CHARS = {'t': '\t', 'n': '\n', 'r': '\r', 'b': '\b', 'f': '\f', '"': '"', "'": "'", '\\': '\\'}
+
+
+def _unescape_turtle(text):
+    return _TURTLE_ESCAPES.sub(lambda m: chr(int(m.group(1) or m.group(2), 16)) if m.group(3) is None
+                               else _TURTLE_CHARS.get(m.group(3), m.group(3)), text)
+
+
+def tsv_to_dataframe(payload, dtype_backend=None):
+    if not payload.strip():
+        return pd.DataFrame()
+    arrow = _use_arrow(dtype_backend)
+    started = monotonic()
+    raw = pd.read_csv(io.BytesIO(payload), sep='\t', dtype=str, keep_default_na=False, na_filter=False,
+                      quoting=csv.QUOTE_NONE, engine='c', encoding='utf-8')
+    typing = monotonic()
+    cols = [c[1:] if c.startswith('?') else c for c in raw.columns]
+    npdata = {}
+    for col, src in zip(cols, raw.columns):
+        npdata[col] = _tsv_column(raw[src].astype(object), arrow)
+    df = pd.DataFrame(columns=cols, data=npdata)
+    recordMetrics(decode_time=typing - started, typing_time=monotonic() - typing)
+    return df
+
+
+def _tsv_column(cells, arrow=False):
+    lexicals = cells.copy()
+    datatypes = pd.Series('', index=cells.index, dtype=object)
+    bound = cells != ''
+
+    isIri = cells.str.startswith('<')
+    datatypes[isIri] = 'uri'
+    isBnode = cells.str.startswith('_:')
+    datatypes[isBnode] = 'bnode'
+    lexicals[isBnode] = cells[isBnode].str[2:]
+
+    isLiteral = cells.str.startswith('"')
+    if isLiteral.any():
+        parts = cells[isLiteral].str.extract(_TSV_LITERAL)
+        lex = parts['lex'].fillna('')
+        escaped = lex.str.contains('\\', regex=False)
+        if escaped.any():
+            lex[escaped] = lex[escaped].map(_unescape_turtle)
+        hasLang = parts['lang'].notna()
+        lex[hasLang] = '"' + lex[hasLang] + '"@' + parts['lang'][hasLang]
+        dts = parts['dt'].fillna('').str.replace(_XSD, '', regex=False)
+        dts[hasLang] = 'lang'
+        lexicals[isLiteral] = lex
+        datatypes[isLiteral] = dts
+
+    bare = bound & ~(isIri | isBnode | isLiteral)
+    if bare.any():
+        for name, pattern in _TURTLE_NUMBERS:
+            datatypes[bare & cells.str.fullmatch(pattern)] = name
+
+    return _typed_column(lexicals.to_numpy(dtype=object), datatypes.to_numpy(dtype=object), bound.to_numpy(), arrow)
+
+
+# ------------------------------------------------------
+# SPARQL 1.1 CSV results into a pandas DataFrame
+# CSV drops datatypes and IRI brackets: numbers and booleans are inferred by
+# pandas' C parser, and text columns whose values all look like absolute IRIs
+# are given back their '<...>'; empty cells (unbound) become None/NaN
+# ------------------------------------------------------
+#
+_ABSOLUTE_IRI = r'[A-Za-z][A-Za-z0-9+.-]*:[^\s<>"{}|^`\\]+'
+
+
+def csv_to_dataframe(payload):
+    if not payload.strip():
+        return pd.DataFrame()
+    started = monotonic()
+    df = pd.read_csv(io.BytesIO(payload), engine='c', keep_default_na=False, na_values=[''], encoding='utf-8')
+    typing = monotonic()
+    for col in df.columns:
+        if df[col].dtype.kind not in 'biufcmM':
+            cells = df[col].astype(object).where(df[col].notna(), None)
+            text = cells.dropna().astype(str)
+            if len(text) and text.str.fullmatch(_ABSOLUTE_IRI).all():
+                cells[cells.notna()] = '<' + text + '>'
+            df[col] = cells
+    recordMetrics(decode_time=typing - started, typing_time=monotonic() - typing)
+    return df
 
 
 ################## JupyterDash and CytoScape Functions ##################
@@ -193,21 +2469,203 @@ def createNodeTypes(iRIs):
 '''
 
 
-labelDict = {}
 prefixDict = {}
 nodeTypes = []
 nodeColors = {}
+# triples explored in this browser session, one TripleStore per graph (see TripleStore)
+sessionStores = {}
+
+
+def getSessionStore(graphName):
+    store = sessionStores.get(graphName)
+    if store is None:
+        store = sessionStores.setdefault(graphName, TripleStore())
+    return store
+
+
+# drops the session store of graphName (all of them for None) when its query
+# results are invalidated, its types would be stale
+def dropSessionStore(graphName=None):
+    if graphName is None:
+        sessionStores.clear()
+    else:
+        sessionStores.pop(graphName, None)
+
+
+queryCache.dependents.append(dropSessionStore)
+
+# ------------------------------------------------------
+# Namespace -> prefix registry used to show IRIs as CURIEs (fl:JFK rather than
+# <https://ontologies.semanticarts.com/flights/JFK>); namespaces are kept in a
+# character trie so the longest matching namespace is found in O(len(IRI)), and
+# compacted forms are cached (the cache is dropped when a prefix is added)
+# ------------------------------------------------------
+#
+class PrefixRegistry:
+    def __init__(self, max_cached=100000):
+        self.root = {}
+        self.max_cached = max_cached
+        self.compacted = {}
+        self.lock = threading.Lock()
+
+    def add(self, prefix, namespace):
+        with self.lock:
+            node = self.root
+            for ch in namespace:
+                node = node.setdefault(ch, {})
+            if node.get(None) != prefix:
+                node[None] = prefix  # None key: a namespace ends here
+                self.compacted = {}
+
+    # 'prefix:local' for '<iri>' (or 'iri'), None when no namespace matches
+    def compact(self, iri):
+        curie = self.compacted.get(iri, False)
+        if curie is not False:
+            return curie
+        text = iri[1:-1] if iri.startswith('<') and iri.endswith('>') else iri
+        node = self.root
+        match = None
+        for i, ch in enumerate(text):
+            if None in node:
+                match = (i, node[None])
+            node = node.get(ch)
+            if node is None:
+                break
+        else:
+            if None in node:
+                match = (len(text), node[None])
+        curie = None if match is None else match[1] + ':' + text[match[0]:]
+        with self.lock:
+            if len(self.compacted) >= self.max_cached:
+                self.compacted = {}
+            self.compacted[iri] = curie
+        return curie
+
+    def clear(self):
+        with self.lock:
+            self.root = {}
+            self.compacted = {}
+
+
+prefixRegistry = PrefixRegistry()
+_PREFIX_DECLARATION = re.compile(r'^\s*prefix\s+([A-Za-z][\w.-]*)?:\s*<([^>]*)>', re.I | re.M)
+
 
 def createPrefixDict(query):
-    lines = query.split('\n')
-    for line in lines:
-        line = line.strip()
-        if re.match('prefix', line, re.I):
-            newLine = line[7:]
-            tempkV = newLine.split(': ', 1)
+    for prefix, namespace in _PREFIX_DECLARATION.findall(query):
+        if prefix != '':
+            prefixDict['<' + namespace.lower() + '>'] = prefix
+            prefixRegistry.add(prefix, namespace)
+
+# ------------------------------------------------------
+# Node and edge labels: a bounded LRU of (graph, IRI) -> label shared by node labels and the
+# labelLabel/sourceLabel/targetLabel of edges; labels that come with query results
+# are put in it, the IRIs still unresolved after an expansion are looked up with
+# one VALUES query for rdfs:label (preferred) and skos:prefLabel, and IRIs without
+# a label are remembered as such so they are not queried again
+#       max_size: number of IRIs kept (least recently used are evicted)
+# ------------------------------------------------------
+#
+class LabelResolver:
+    predicates = ('<http://www.w3.org/2000/01/rdf-schema#label>', '<http://www.w3.org/2004/02/skos/core#prefLabel>')
+
+    def __init__(self, max_size=10000, chunk_size=1000):
+        self.max_size = max_size
+        self.chunk_size = chunk_size
+        self.labels = OrderedDict()  # (graphName, iri) -> label, None when it has none
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.queries = 0
+
+    # label of iri in graphName, None when unknown (or known to have none)
+    def get(self, iri, graphName):
+        key = (graphName, iri)
+        with self.lock:
+            if key in self.labels:
+                self.labels.move_to_end(key)
+                self.hits += 1
+                return self.labels[key]
+            self.misses += 1
+            return None
+
+    def put(self, iri, label, graphName):
+        key = (graphName, iri)
+        with self.lock:
+            self.labels[key] = label
+            self.labels.move_to_end(key)
+            while len(self.labels) > self.max_size:
+                self.labels.popitem(last=False)
+
+    def known(self, iri, graphName):
+        with self.lock:
+            return (graphName, iri) in self.labels
+
+    # fetches the labels of the IRIs among iris that are not cached yet
+    def resolve(self, iris, graphName, endpoint=None):
+        missing = [iri for iri in dict.fromkeys(iris)
+                   if isinstance(iri, str) and iri.startswith('<') and not self.known(iri, graphName)]
+        for i in range(0, len(missing), self.chunk_size):
+            chunk = missing[i:i + self.chunk_size]
+            query = createLabelsQuery(' '.join(chunk), graphName, self.predicates)
+            df = create_dataframe(getEndpoint(endpoint), query)
+            with self.lock:
+                self.queries += 1
+            found = {}
+            for iri, predicate, label in zip(df['s'], df['p'], df['label']):
+                rank = self.predicates.index(predicate) if predicate in self.predicates else len(self.predicates)
+                if iri not in found or rank < found[iri][0]:
+                    found[iri] = (rank, labelText(label))
+            for iri in chunk:
+                self.put(iri, found[iri][1] if iri in found else None, graphName)
+
+    # forgets the labels of graphName, or all of them
+    def clear(self, graphName=None):
+        with self.lock:
+            if graphName is None:
+                self.labels.clear()
+                self.hits = self.misses = self.queries = 0
+                return
+            for key in [key for key in self.labels if key[0] == graphName]:
+                del self.labels[key]
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {'size': len(self.labels), 'max_size': self.max_size, 'hits': self.hits,
+                    'misses': self.misses, 'hit_rate': self.hits / lookups if lookups else 0.0,
+                    'queries': self.queries}
+
+
+labelResolver = LabelResolver()
+queryCache.dependents.append(labelResolver.clear)
+
+
+def createLabelsQuery(iris, graphName, predicates):
+    return '''select ?s ?p ?label from ''' + graphName + '''
+where {
+    VALUES ?s { ''' + iris + ''' }
+    VALUES ?p { ''' + ' '.join(predicates) + ''' }
+    ?s ?p ?label .
+}
+'''
+
+
+# display text of a label value ('"text"@lang' literals as returned for language
+# tagged labels become text)
+def labelText(value):
+    if isinstance(value, str) and value.startswith('"'):
+        return split_literal(value)[0]
+    return value if isinstance(value, str) else str(value)
+
+
+# label shown for iri: its label in graphName, else its CURIE, else the IRI itself
+def getLabel(iri, graphName=None):
+    label = labelResolver.get(iri, graphName)
+    if label is not None:
+        return label
+    return prefixRegistry.compact(iri) or iri
 
-            if tempkV[0] != '':
-                prefixDict[tempkV[1].lower()] = tempkV[0]
 
 def createTypesOfNodesQuery(graphName):
     query =  '''PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
@@ -225,9 +2683,9 @@ def createTypesOfNodesQuery(graphName):
     return query
 
 
-def getTypesOfNodes(graphName):
+def getTypesOfNodes(graphName, endpoint=None):
     query = createTypesOfNodesQuery(graphName)
-    df = create_dataframe('127.0.0.1:7070', query)
+    df = create_dataframe(getEndpoint(endpoint), query)
     for nodeType in df['type']:
         nodeTypes.append(nodeType)
     return sorted(nodeTypes)
@@ -246,71 +2704,35 @@ def assignColorsToNode(colorCode):
     return True
 
 
-def createGraph(query, rootNode, graphName):
+def createGraph(query, rootNode, graphName, endpoint=None):
     #     print('Inside')
 
     createPrefixDict(query)
 
-    flights = run_query('127.0.0.1:7070', query)
-
-    x = flights.decode("utf-8")
-
-    a = x.split(".\n")
-    a = a[1: len(a) - 1]
-    triples = set()
-    for ele in a:
-        ele = ele[:len(ele) - 1]
-        triples.add(ele)
-    # nodeNames = set()
-
-    graph = []
-    nodes = set()
-    edges = set()
-
-    # for ele in triples:
-    #     arr = ele.split(' ')
-    #     print(arr[0])
-
-    for ele in triples:
-        arr = ele.split(' ')
-        p = arr[1].split('/')
-        p = p[len(p) - 1]
-        p = p[:len(p) - 1]
-
-        if "label" in p:
-            s = arr[0]
-            o = arr[2][1:len(arr[2]) - 1]
-            labelDict[s.lower()] = o
-
-    for ele in triples:
-        arr = ele.split(' ')
-        s = arr[0]
-        p = arr[1]
-        o = arr[2]
-
-        nodes.add(s)
-
-        if arr[2][0] == '<' and arr[2][len(arr[2]) - 1] == '>':
-            nodes.add(o)
-            graph.append({'S': s, 'P': p, 'O': o})
-            edges.add(p)
-
-    nodes = nodes - edges
-    nodeUri = ''
-
-    for node in nodes:
-        nodeUri += node + ' '
-
-    nodeType = getNodeTypes(nodeUri, graphName)
+    store = getSessionStore(graphName)
+    batch = store.add(iter_triples(getEndpoint(endpoint), query))
+    term = store.terms.terms.__getitem__
+    predicates = np.unique(batch[:, 1])
+    objects = np.unique(batch[:, 2])
 
+    isLabel = np.isin(batch[:, 1], [p for p in predicates if "label" in term(p).rstrip('>').rsplit('/', 1)[-1]])
+    isLiteral = np.isin(batch[:, 2], [o for o in objects if term(o).startswith('"')])
+    for s, o in batch[isLabel & isLiteral][:, [0, 2]].tolist():
+        labelResolver.put(term(s), split_literal(term(o))[0], graphName)
 
+    links = batch[np.isin(batch[:, 2], [o for o in objects if term(o).startswith('<')])]
+    graph = [{'S': term(s), 'P': term(p), 'O': term(o)} for s, p, o in links.tolist()]
 
+    # subjects and linked objects, except the IRIs used as edges
+    nodes = [term(n) for n in np.setdiff1d(np.union1d(batch[:, 0], links[:, 2]), links[:, 1])]
 
+    nodeType = getStoredNodeTypes(nodes, graphName, endpoint=endpoint)
+    labelResolver.resolve(nodes + [ele['P'] for ele in graph], graphName, endpoint)
 
     elements = []
     for node in nodes:
         elements.append({'data': {'id': node,
-                                  'label': labelDict.get(node.lower(), prefixDict.get(node.lower(), node)),
+                                  'label': getLabel(node, graphName),
                                   'expanded': False,
                                   'source': rootNode,
                                   'color': nodeColors[nodeType[node]],
@@ -321,9 +2743,9 @@ def createGraph(query, rootNode, graphName):
         elements.append({'data': {'source': ele['S'],
                                   'target': ele['O'],
                                   'label': ele['P'],
-                                  'labelLabel': labelDict.get(ele['P'].lower(), prefixDict.get(ele['P'].lower(), ele['P'])),
-                                  'sourceLabel': labelDict.get(ele['S'].lower(), prefixDict.get(ele['S'].lower(), ele['S'])),
-                                  'targetLabel': labelDict.get(ele['O'].lower(), prefixDict.get(ele['O'].lower(), ele['O'])),
+                                  'labelLabel': getLabel(ele['P'], graphName),
+                                  'sourceLabel': getLabel(ele['S'], graphName),
+                                  'targetLabel': getLabel(ele['O'], graphName),
                                   'type': 'Edge'
                                   }
                          })
@@ -355,34 +2777,39 @@ select ?s ?p ?obj ?obj_type ?obj_label ?p_label from ''' + graphName + '''
     createPrefixDict(query)
     return query
 
-def getNeighbours(query):
-    df = create_dataframe('127.0.0.1:7070', query)
+def getNeighbours(query, endpoint=None):
+    df = create_dataframe(getEndpoint(endpoint), query)
     return df
 
 
 # def generateNodes(df):
 
 
-def generateNodes(df, sourceURI, graphName):
-    # verify to check whether new nodes can be repetitve and accordingly create a set of nodes and then a list of newNodes
+def generateNodes(df, sourceURI, graphName, endpoint=None):
+    # one node per neighbour IRI (a neighbour can appear in several rows)
     newNodes = []
 
-    # insert label of node into dict
+    # labels that came with the neighbours, then one query for the IRIs still unlabeled
     for i in df.index:
         if df['obj_label'][i] and type(df['obj_label'][i]) == str:
-            labelDict[df['obj'][i].lower()] = df['obj_label'][i]
-
-    nodeUri = ''
-
-    for i in df.index:
-        nodeUri += df['obj'][i] + ' '
+            labelResolver.put(df['obj'][i], labelText(df['obj_label'][i]), graphName)
+        if df['p_label'][i] and type(df['p_label'][i]) == str:
+            labelResolver.put(df['p'][i], labelText(df['p_label'][i]), graphName)
+    labelResolver.resolve(list(df['s']) + list(df['p']) + list(df['obj']), graphName, endpoint)
 
-    nodeType = getNodeTypes(nodeUri, graphName)
+    # types of the neighbours come with them
+    getSessionStore(graphName).add((df['obj'][i], _RDF_TYPE, df['obj_type'][i]) for i in df.index
+                                   if isinstance(df['obj_type'][i], str))
+    nodeType = getStoredNodeTypes(list(dict.fromkeys(df['obj'])), graphName, endpoint=endpoint)
 
+    seen = set()
     for i in df.index:
+        if df['obj'][i] in seen:
+            continue
+        seen.add(df['obj'][i])
 
         newNode = {'data': {'id': df['obj'][i],
-                            'label': labelDict.get(df['obj'][i].lower(), prefixDict.get(df['obj'][i].lower(), df['obj'][i])),
+                            'label': getLabel(df['obj'][i], graphName),
                             'expanded': False,
                             'source': sourceURI,
                             'target': None,
@@ -390,33 +2817,36 @@ def generateNodes(df, sourceURI, graphName):
                             'type': 'Node'
                             }
                    }
-        if newNode not in newNodes:
-            newNodes.append(newNode)
-            # print("0", newNode)
+        newNodes.append(newNode)
     return newNodes
 
 
-def generateEdges(df):
+def generateEdges(df, graphName=None):
     newEdges = []
+    getSessionStore(graphName).add(zip(df['s'], df['p'], df['obj']))
 
-    # insert label of edge into dict
+    # insert label of edge into labelResolver
     for i in df.index:
         if df['p_label'][i] and type(df['p_label'][i]) == str:
-            labelDict[df['p'][i].lower()] = df['p_label'][i]
+            labelResolver.put(df['p'][i], labelText(df['p_label'][i]), graphName)
 
+    seen = set()
     for i in df.index:
+        key = (df['s'][i], df['p'][i], df['obj'][i])
+        if key in seen:
+            continue
+        seen.add(key)
 
         newEdge = {'data': {'source': df['s'][i],
                             'target': df['obj'][i],
                             'label': df['p'][i],
-                            'labelLabel': labelDict.get(df['p'][i].lower(), prefixDict.get(df['p'][i].lower(), df['p'][i])),
-                            'sourceLabel': labelDict.get(df['s'][i].lower(), prefixDict.get(df['s'][i].lower(), df['s'][i])),
-                            'targetLabel': labelDict.get(df['obj'][i].lower(), prefixDict.get(df['obj'][i].lower(), df['obj'][i])),
+                            'labelLabel': getLabel(df['p'][i], graphName),
+                            'sourceLabel': getLabel(df['s'][i], graphName),
+                            'targetLabel': getLabel(df['obj'][i], graphName),
                             'type': 'Edge'
                             }
                    }
-        if newEdge not in newEdges:
-            newEdges.append(newEdge)
+        newEdges.append(newEdge)
 
     return newEdges
 
@@ -445,16 +2875,117 @@ where {
 '''
 
 
-def getNodeTypes(uris, graphName):
-    query = createAssignNodeTypes(uris, graphName)
-    df = create_dataframe('127.0.0.1:7070', query)
+# ------------------------------------------------------
+# Types of node IRIs for getNodeTypes: a bounded LRU of (graphName, iri) -> type,
+# None for IRIs known to have no type; a graph's entries are dropped whenever
+# queryCache is invalidated for it (e.g. after an update to the graph)
+#       max_size: number of IRIs kept (least recently used are evicted)
+# ------------------------------------------------------
+#
+class NodeTypeCache:
+    def __init__(self, max_size=100000):
+        self.max_size = max_size
+        self.types = OrderedDict()  # (graphName, iri) -> type, None when it has none
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.types)
+
+    # (True, type of iri in graphName) when it is cached, else (False, None)
+    def lookup(self, iri, graphName):
+        key = (graphName, iri)
+        with self.lock:
+            if key not in self.types:
+                return False, None
+            self.types.move_to_end(key)
+            return True, self.types[key]
+
+    def put(self, iri, nodeType, graphName):
+        key = (graphName, iri)
+        with self.lock:
+            self.types[key] = nodeType
+            self.types.move_to_end(key)
+            while len(self.types) > self.max_size:
+                self.types.popitem(last=False)
+
+    # forgets the types of graphName, or all of them
+    def invalidate(self, graphName=None):
+        with self.lock:
+            if graphName is None:
+                self.types.clear()
+                return
+            for key in [key for key in self.types if key[0] == graphName]:
+                del self.types[key]
+
+
+nodeTypeCache = NodeTypeCache()
+queryCache.dependents.append(nodeTypeCache.invalidate)
+nodeTypesChunkSize = 200
+nodeTypesWorkers = 4
+
+
+# uris: IRIs as a whitespace separated string or a list; types already in nodeTypeCache
+# are not queried again, the rest are resolved in VALUES chunks of chunk_size run in parallel
+def getNodeTypes(uris, graphName, chunk_size=None, max_workers=None, endpoint=None):
+    if isinstance(uris, str):
+        uris = uris.split()
+    chunk_size = chunk_size or nodeTypesChunkSize
+    max_workers = max_workers or nodeTypesWorkers
+
+    nodeTypes = {}
+    missing = []
+    for uri in dict.fromkeys(uris):
+        known, nodeType = nodeTypeCache.lookup(uri, graphName)
+        if not known:
+            missing.append(uri)
+        elif nodeType is not None:
+            nodeTypes[uri] = nodeType
+
+    chunks = [missing[i:i + chunk_size] for i in range(0, len(missing), chunk_size)]
+    if len(chunks) <= 1 or max_workers <= 1:
+        results = [getNodeTypesChunk(chunk, graphName, endpoint) for chunk in chunks]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(chunks))) as executor:
+            futures = [executor.submit(contextvars.copy_context().run, getNodeTypesChunk, chunk, graphName, endpoint)
+                       for chunk in chunks]
+            results = [future.result() for future in futures]
+
+    for chunk, chunkTypes in zip(chunks, results):
+        for uri in chunk:
+            nodeTypeCache.put(uri, chunkTypes.get(uri), graphName)
+        nodeTypes.update(chunkTypes)
+    return nodeTypes
+
+
+# types of uris from the session store of graphName (preferring a type that has a
+# color), the ones it does not know are fetched with getNodeTypes and added to it
+def getStoredNodeTypes(uris, graphName, endpoint=None):
+    store = getSessionStore(graphName)
+    nodeTypes = {}
+    missing = []
+    for uri in uris:
+        types = store.objects(uri, _RDF_TYPE)
+        if types:
+            nodeTypes[uri] = next((t for t in types if t in nodeColors), types[0])
+        else:
+            missing.append(uri)
+    if missing:
+        fetched = getNodeTypes(missing, graphName, endpoint=endpoint)
+        store.add((uri, _RDF_TYPE, nodeType) for uri, nodeType in fetched.items())
+        nodeTypes.update(fetched)
+    return nodeTypes
+
+
+def getNodeTypesChunk(uris, graphName, endpoint=None):
+    query = createAssignNodeTypes(' '.join(uris), graphName)
+    df = create_dataframe(getEndpoint(endpoint), query)
     nodeTypes = {}
     for i in range(0, len(df)):
         nodeTypes[df['s'][i]] = df['type'][i]
     return nodeTypes
 
 
-def getNodeInfo(uri, graphName):
+def getNodeInfo(uri, graphName, endpoint=None):
     query = '''PREFIX rdfs: <http://www.w3.org/2000/01/rdf-schema#>
             prefix fl: <https://ontologies.semanticarts.com/flights/>
             prefix rdfs: <http://www.w3.org/2000/01/rdf-schema#>
@@ -467,7 +2998,7 @@ def getNodeInfo(uri, graphName):
                 FILTER (?s = ''' + uri + ''' ) 
                     }
             limit 30'''
-    df = create_dataframe('127.0.0.1:7070', query)
+    df = create_dataframe(getEndpoint(endpoint), query)
     return df
 
 ##################Graph Browser Layout##################
@@ -481,6 +3012,13 @@ styles = {
     'tab': {'height': 'calc(98vh - 115px)'}
 }
 
+# id of one browser page, kept in the 'session-id' Store of getAppLayout and used in
+# the cancel_key of the tap callbacks; pass the layout as a function
+# (app.layout = lambda: getAppLayout(...)) so that every page load gets its own
+def newSessionId():
+    return uuid.uuid4().hex
+
+
 def getAppLayout(elements, nodeWidth, nodeHeight, putLabelInsideNode):
 
     textHalignValue = ''
@@ -491,6 +3029,8 @@ def getAppLayout(elements, nodeWidth, nodeHeight, putLabelInsideNode):
 
     return html.Div([
 
+        dcc.Store(id='session-id', data=newSessionId()),
+
         html.Div(className='a', children=[
             dcc.Dropdown(
                 id='dropdown-update-layout',
@@ -554,10 +3094,23 @@ def getAppLayout(elements, nodeWidth, nodeHeight, putLabelInsideNode):
 
 
 ###################CALLBACKS###################
-import json
-def displayTapNodeData(data, graphName):
+
+# total seconds the queries of one tap may take (None: no limit), see queryDeadline
+interactionBudget = None
+
+
+# cancel_key: a per-session key, e.g. ('displayTapNodeData', data of the 'session-id'
+# Store); a newer tap with the same key cancels this one's queries (see supersede).
+# None supersedes nothing.
+def displayTapNodeData(data, graphName, endpoint=None, budget=None, cancel_key=None):
     if data:
-        df = getNodeInfo(data['id'], graphName)
+        try:
+            with supersede(cancel_key), queryDeadline(budget if budget is not None else interactionBudget):
+                df = getNodeInfo(data['id'], graphName, endpoint)
+        except QueryCancelled:
+            raise PreventUpdate  # superseded by a newer tap
+        except DeadlineExceeded:
+            raise PreventUpdate  # out of interactionBudget, keep what is shown
         out = {}
         for i in range(0,len(df)):
             out[df['p'][i]] = df['o'][i]
@@ -577,7 +3130,45 @@ def update_layout(layout):
     }
 
 
-def generate_elements(data, e, options, graphName):
+# ------------------------------------------------------
+# Hash index over a list of Cytoscape elements: nodes by id and edges by
+# (source, predicate, target), so duplicate checks and lookups are O(1) instead of
+# comparing whole element dicts against every element on the canvas
+# (Dash hands callbacks a freshly deserialized list, so the index is built once per
+# callback in O(n) and kept up to date as elements are added)
+# ------------------------------------------------------
+#
+class ElementIndex:
+    def __init__(self, elements):
+        self.elements = elements
+        self.keys = {}
+        for element in elements:
+            self.keys.setdefault(self.key(element), element)
+
+    @staticmethod
+    def key(element):
+        data = element['data']
+        if data.get('type') == 'Edge':
+            return data.get('source'), data.get('label'), data.get('target')
+        return data.get('id')
+
+    def __contains__(self, element):
+        return self.key(element) in self.keys
+
+    def node(self, nodeId):
+        return self.keys.get(nodeId)
+
+    # appends element unless one with the same key is already there
+    def add(self, element):
+        key = self.key(element)
+        if key in self.keys:
+            return False
+        self.keys[key] = element
+        self.elements.append(element)
+        return True
+
+
+def generate_elements(data, e, options, graphName, endpoint=None, budget=None, cancel_key=None):
     if not data or not e:
         return e
 
@@ -589,35 +3180,41 @@ def generate_elements(data, e, options, graphName):
 
         if data and e:
 
+            index = ElementIndex(e)
+
             # changing extended to True for the node
-            for element in e:
-                if data['id'] == element.get('data').get('id'):
-                    element['data']['expanded'] = True
-                    break
+            element = index.node(data['id'])
+            if element is not None:
+                element['data']['expanded'] = True
 
             # Demo: get neighboring airport creation statement for airlines data
             neighborQuery = createGetNeighborsQuery(nodeURI, graphName)
-            df = getNeighbours(neighborQuery)
-            nodes = generateNodes(df, nodeURI, graphName)
-            edges = generateEdges(df)
+            try:
+                with supersede(cancel_key), queryDeadline(budget if budget is not None else interactionBudget):
+                    df = getNeighbours(neighborQuery, endpoint)
+                    nodes = generateNodes(df, nodeURI, graphName, endpoint)
+            except QueryCancelled:
+                raise PreventUpdate  # superseded by a newer tap
+            except DeadlineExceeded:
+                raise PreventUpdate  # out of interactionBudget, keep the canvas as it is
+            edges = generateEdges(df, graphName)
 
             for node in nodes:
-                if node not in e:
-                    e.append(node)
+                index.add(node)
 
             for edge in edges:
-                if edge not in e:
-                    e.append(edge)
+                index.add(edge)
 
         return e
     elif options == "Hide Node":
-        return removeNodes(e, nodeURI)
+        return removeNodes(e, nodeURI, graphName)
 
     else:
         return e
 
-def removeNodes(element, nodeURI):
+def removeNodes(element, nodeURI, graphName=None):
     copyElement = []
+    removedEdges = []
     for e in element:
         if e['data']['type'] == 'Node':
             if e['data']['id'] == nodeURI:
@@ -625,6 +3222,8 @@ def removeNodes(element, nodeURI):
                 continue
         if e['data']['type'] == 'Edge':
             if e['data']['source'] == nodeURI or e['data']['target'] == nodeURI:
+                removedEdges.append((e['data']['source'], e['data']['label'], e['data']['target']))
                 continue
         copyElement.append(e)
+    getSessionStore(graphName).discard(removedEdges)
     return copyElement
\ No newline at end of file